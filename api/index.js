@@ -18,6 +18,9 @@ const LLM_SERVICE_URL = process.env.LLM_SERVICE_URL || 'http://localhost:5000';
 const TTS_SERVICE_URL = process.env.TTS_SERVICE_URL || 'http://localhost:6000';
 const WEBRTC_SERVICE_URL = process.env.WEBRTC_SERVICE_URL || 'http://localhost:8080';
 const ALLOWED_ORIGINS = process.env.ALLOWED_ORIGINS ? process.env.ALLOWED_ORIGINS.split(',') : ['*'];
+const TTS_SAMPLE_RATE = parseInt(process.env.TTS_SAMPLE_RATE || '24000', 10);
+const CONVERSE_MAX_SENTENCE_CHARS = parseInt(process.env.CONVERSE_MAX_SENTENCE_CHARS || '200', 10);
+const CONVERSE_MAX_TTS_CONCURRENCY = Math.max(1, parseInt(process.env.CONVERSE_MAX_TTS_CONCURRENCY || '2', 10));
 
 // Setup temporary storage for uploaded files
 const uploadDir = path.join(__dirname, 'uploads');
@@ -92,7 +95,7 @@ app.get('/health', (req, res) => {
 // LLM API routes (similar to OpenAI's format)
 app.post('/v1/chat/completions', async (req, res) => {
   try {
-    const { model, messages, max_tokens, temperature, stream } = req.body;
+    const { model, messages, max_tokens, temperature, stream, deadline_ms } = req.body;
     
     if (!messages || !Array.isArray(messages) || messages.length === 0) {
       return res.status(400).json({ error: 'Invalid messages format' });
@@ -103,17 +106,26 @@ app.post('/v1/chat/completions', async (req, res) => {
       model: model || 'llama-3',
       messages,
       max_tokens: max_tokens || 100,
-      temperature: temperature || 0.7,
-      stream: stream || false
-    });
+      temperature: temperature ?? 0.7,
+      stream: stream || false,
+      ...(deadline_ms ? { deadline_ms } : {})
+    }, stream ? { responseType: 'stream' } : {});
 
     if (stream) {
-      // Handle streaming response
+      // Relay the SSE frames as they arrive instead of buffering the whole reply
       res.setHeader('Content-Type', 'text/event-stream');
       res.setHeader('Cache-Control', 'no-cache');
       res.setHeader('Connection', 'keep-alive');
+      res.setHeader('X-Accel-Buffering', 'no');
+      res.flushHeaders();
 
       response.data.pipe(res);
+      // Closing the upstream stream lets the LLM service cancel generation for a departed client
+      res.on('close', () => {
+        if (!res.writableFinished) {
+          response.data.destroy();
+        }
+      });
     } else {
       // Handle regular response
       res.json({
@@ -152,7 +164,7 @@ app.post('/v1/chat/completions', async (req, res) => {
 // TTS API routes
 app.post('/v1/audio/speech', async (req, res) => {
   try {
-    const { text, voice, format, speed } = req.body;
+    const { text, voice, format, speed, deadline_ms } = req.body;
     
     if (!text) {
       return res.status(400).json({ error: 'Text is required' });
@@ -163,7 +175,8 @@ app.post('/v1/audio/speech', async (req, res) => {
       text,
       voice: voice || 'default',
       format: format || 'mp3',
-      speed: speed || 1.0
+      speed: speed || 1.0,
+      ...(deadline_ms ? { deadline_ms } : {})
     }, {
       responseType: 'arraybuffer'
     });
@@ -183,6 +196,348 @@ app.post('/v1/audio/speech', async (req, res) => {
   }
 });
 
+// WAV header for a stream whose total length is not known up front (16-bit mono PCM)
+function wavStreamHeader(sampleRate) {
+  const header = Buffer.alloc(44);
+  header.write('RIFF', 0);
+  header.writeUInt32LE(0xFFFFFFFF, 4);
+  header.write('WAVE', 8);
+  header.write('fmt ', 12);
+  header.writeUInt32LE(16, 16);
+  header.writeUInt16LE(1, 20);
+  header.writeUInt16LE(1, 22);
+  header.writeUInt32LE(sampleRate, 24);
+  header.writeUInt32LE(sampleRate * 2, 28);
+  header.writeUInt16LE(2, 32);
+  header.writeUInt16LE(16, 34);
+  header.write('data', 36);
+  header.writeUInt32LE(0xFFFFFFFF, 40);
+  return header;
+}
+
+// Split completed sentences off the front of streamed text; long sentences break at clause boundaries
+// Words whose trailing period does not end a sentence, kept in sync with ABBREVIATIONS in tts/server.py
+const ABBREVIATIONS = new Set([
+  'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'vs', 'etc', 'e.g', 'i.e',
+  'inc', 'ltd', 'co', 'corp', 'approx', 'dept', 'est', 'jan', 'feb',
+  'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec', 'a.m', 'p.m'
+]);
+// Abbreviations that are also ordinary words, so only "No. 5" or "Fig. 2" keeps them in the sentence
+const NUMBER_ABBREVIATIONS = new Set(['no', 'fig', 'mar', 'vol']);
+
+// Whether text ends in an abbreviation or an initial rather than the end of a sentence
+function isAbbreviation(text, nextText) {
+  if (!text.endsWith('.')) {
+    return false;
+  }
+  const words = text.split(/\s+/);
+  const word = words[words.length - 1].slice(0, -1).toLowerCase();
+  if (NUMBER_ABBREVIATIONS.has(word)) {
+    // Nothing after it yet: wait for the next token rather than guess
+    return nextText === '' || /^\d/.test(nextText);
+  }
+  return ABBREVIATIONS.has(word) || /^\p{L}$/u.test(word);
+}
+
+// End of the first sentence in text, skipping periods of abbreviations and initials, or -1
+function findSentenceEnd(text) {
+  const pattern = /[.!?]+["')\]]*\s+/g;
+  let match;
+  while ((match = pattern.exec(text)) !== null) {
+    const end = match.index + match[0].length;
+    if (!isAbbreviation(text.slice(0, end).trimEnd(), text.slice(end))) {
+      return end;
+    }
+  }
+  return -1;
+}
+
+function takeSentences(text, maxChars, flush) {
+  const sentences = [];
+  let rest = text;
+
+  while (rest) {
+    const end = findSentenceEnd(rest);
+    if (end > 0 && end <= maxChars) {
+      sentences.push(rest.slice(0, end));
+      rest = rest.slice(end);
+      continue;
+    }
+    if (rest.length <= maxChars) {
+      break;
+    }
+    // Too long without a sentence end: cut at the last clause boundary, or the last space
+    const head = rest.slice(0, maxChars);
+    const clause = Math.max(head.lastIndexOf(', '), head.lastIndexOf('; '), head.lastIndexOf(': '));
+    const cut = clause > 0 ? clause + 2 : head.lastIndexOf(' ') + 1;
+    if (cut <= 0) {
+      break;
+    }
+    sentences.push(rest.slice(0, cut));
+    rest = rest.slice(cut);
+  }
+
+  if (flush && rest) {
+    sentences.push(rest);
+    rest = '';
+  }
+  // Fragments without any words (e.g. a lone "...") produce no speech
+  return {
+    sentences: sentences.map((sentence) => sentence.trim()).filter((sentence) => /\w/.test(sentence)),
+    rest
+  };
+}
+
+// Format stage durations (ms) as a Server-Timing header value
+function serverTiming(timings) {
+  return Object.entries(timings)
+    .filter(([, duration]) => duration !== null)
+    .map(([name, duration]) => `${name};dur=${duration}`)
+    .join(', ');
+}
+
+// Error message of an upstream JSON error body, which is still a stream when the request was streamed
+async function upstreamErrorMessage(data) {
+  if (data && typeof data.on === 'function') {
+    let body = '';
+    for await (const chunk of data) {
+      body += chunk;
+    }
+    data = body;
+  }
+  if (typeof data === 'string') {
+    try {
+      data = JSON.parse(data);
+    } catch (error) {
+      return data || null;
+    }
+  }
+  return data && data.error ? (data.error.message || String(data.error)) : null;
+}
+
+// Header values must be a single line of Latin-1; upstream error messages can be neither
+function trailerValue(text) {
+  return String(text).replace(/[^\x20-\x7e]+/g, ' ').trim().slice(0, 300);
+}
+
+// Conversational pipeline: stream LLM tokens and synthesize each sentence as soon as it is complete
+app.post('/v1/converse', async (req, res) => {
+  const { model, messages, max_tokens, temperature, voice, speed, format, conversation_id, deadline_ms } = req.body;
+
+  if (!messages || !Array.isArray(messages) || messages.length === 0) {
+    return res.status(400).json({ error: 'Invalid messages format' });
+  }
+  const outputFormat = (format || 'wav').toLowerCase();
+  if (!['wav', 'pcm'].includes(outputFormat)) {
+    return res.status(400).json({ error: 'Format must be wav or pcm' });
+  }
+
+  const startedAt = Date.now();
+  const timings = {
+    llm_first_token: null,
+    llm_first_sentence: null,
+    llm_total: null,
+    tts_first_sentence: null,
+    tts_total: 0,
+    first_audio: null,
+    total: null
+  };
+  let sentenceCount = 0;
+  let failure = null;
+  let output = Promise.resolve();
+
+  // Only a few sentences synthesize at once, so a long reply doesn't fill the TTS queue on its own
+  let activeSyntheses = 0;
+  const waitingSyntheses = [];
+  const acquireSynthesis = () => new Promise((resolve) => {
+    if (activeSyntheses < CONVERSE_MAX_TTS_CONCURRENCY) {
+      activeSyntheses += 1;
+      resolve();
+    } else {
+      waitingSyntheses.push(resolve);
+    }
+  });
+  const releaseSynthesis = () => {
+    const next = waitingSyntheses.shift();
+    if (next) {
+      next();
+    } else {
+      activeSyntheses -= 1;
+    }
+  };
+
+  // A deadline covers the whole reply, so each upstream call gets what is left of it
+  const remainingDeadline = () => (
+    deadline_ms ? { deadline_ms: Math.max(1, deadline_ms - (Date.now() - startedAt)) } : {}
+  );
+
+  // Stop generating and synthesizing as soon as the client goes away
+  const controller = new AbortController();
+  res.on('close', () => {
+    if (!res.writableFinished) {
+      controller.abort();
+    }
+  });
+
+  const startAudio = () => {
+    if (res.headersSent) {
+      return;
+    }
+    res.status(200);
+    res.setHeader('Content-Type', outputFormat === 'wav' ? 'audio/wav' : `audio/L16;rate=${TTS_SAMPLE_RATE};channels=1`);
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('X-Accel-Buffering', 'no');
+    res.setHeader('Trailer', 'Server-Timing, X-Converse-Sentences, X-Converse-Error');
+    // Trailers need chunked encoding, which an empty reply would otherwise not get
+    res.flushHeaders();
+    if (outputFormat === 'wav') {
+      res.write(wavStreamHeader(TTS_SAMPLE_RATE));
+    }
+  };
+
+  const speak = (sentence) => {
+    let requestedAt;
+    sentenceCount += 1;
+
+    // Synthesis starts as soon as a slot is free, overlapping with generation and with earlier sentences
+    const audio = acquireSynthesis().then(() => {
+      requestedAt = Date.now();
+      return axios.post(`${TTS_SERVICE_URL}/tts`, {
+        text: sentence,
+        voice: voice || 'default',
+        format: 'pcm',
+        speed: speed || 1.0,
+        ...remainingDeadline()
+      }, {
+        responseType: 'arraybuffer',
+        signal: controller.signal
+      }).finally(releaseSynthesis);
+    }).then((response) => {
+      const elapsed = Date.now() - requestedAt;
+      timings.tts_total += elapsed;
+      if (timings.tts_first_sentence === null) {
+        timings.tts_first_sentence = elapsed;
+      }
+      return Buffer.from(response.data);
+    });
+    // Mark the rejection as handled now; it is reported when this sentence's turn comes
+    audio.catch(() => {});
+
+    // Audio is written strictly in sentence order
+    output = output
+      .then(() => audio)
+      .then((pcm) => {
+        if (failure || res.destroyed) {
+          return;
+        }
+        startAudio();
+        if (timings.first_audio === null) {
+          timings.first_audio = Date.now() - startedAt;
+        }
+        res.write(pcm);
+      })
+      .catch((error) => {
+        failure = failure || `TTS: ${error.message}`;
+      });
+  };
+
+  const speakSentences = (sentences) => {
+    if (sentences.length && timings.llm_first_sentence === null) {
+      timings.llm_first_sentence = Date.now() - startedAt;
+    }
+    sentences.forEach(speak);
+  };
+
+  try {
+    const llmResponse = await axios.post(`${LLM_SERVICE_URL}/generate`, {
+      model: model || 'llama-3',
+      messages,
+      max_tokens: max_tokens || 100,
+      temperature: temperature ?? 0.7,
+      stream: true,
+      ...(conversation_id ? { conversation_id } : {}),
+      ...remainingDeadline()
+    }, {
+      responseType: 'stream',
+      signal: controller.signal
+    });
+    llmResponse.data.setEncoding('utf8');
+
+    let partialLine = '';
+    let text = '';
+    for await (const chunk of llmResponse.data) {
+      const lines = (partialLine + chunk).split('\n');
+      partialLine = lines.pop();
+
+      for (const line of lines) {
+        if (!line.startsWith('data:')) {
+          continue;
+        }
+        const payload = line.slice(5).trim();
+        if (payload === '[DONE]') {
+          continue;
+        }
+        const frame = JSON.parse(payload);
+        if (frame.error) {
+          throw new Error(frame.error);
+        }
+        if (!frame.text) {
+          continue;
+        }
+        if (timings.llm_first_token === null) {
+          timings.llm_first_token = Date.now() - startedAt;
+        }
+
+        const { sentences, rest } = takeSentences(text + frame.text, CONVERSE_MAX_SENTENCE_CHARS, false);
+        text = rest;
+        speakSentences(sentences);
+      }
+    }
+
+    timings.llm_total = Date.now() - startedAt;
+    speakSentences(takeSentences(text, CONVERSE_MAX_SENTENCE_CHARS, true).sentences);
+  } catch (error) {
+    if (controller.signal.aborted) {
+      return;
+    }
+    if (error.response && error.response.status === 503 && !res.headersSent) {
+      return res.status(503)
+        .set('Retry-After', error.response.headers['retry-after'] || '1')
+        .json({ error: { message: 'LLM service is busy, please retry later', type: 'server_busy' } });
+    }
+    // Client errors, such as a max_tokens that leaves no room for the messages, keep their status
+    if (error.response && error.response.status >= 400 && error.response.status < 500 && !res.headersSent) {
+      const message = await upstreamErrorMessage(error.response.data);
+      return res.status(error.response.status)
+        .json({ error: { message: message || 'Invalid request', type: 'invalid_request_error' } });
+    }
+    console.error('Error in converse request:', error.message);
+    failure = failure || `LLM: ${error.message}`;
+  }
+
+  await output;
+  if (controller.signal.aborted) {
+    return;
+  }
+  if (!res.headersSent && failure) {
+    return res.status(500).json({
+      error: {
+        message: 'Error processing conversation request',
+        type: 'server_error'
+      }
+    });
+  }
+
+  startAudio();
+  timings.total = Date.now() - startedAt;
+  res.addTrailers({
+    'Server-Timing': serverTiming(timings),
+    'X-Converse-Sentences': String(sentenceCount),
+    ...(failure ? { 'X-Converse-Error': trailerValue(failure) } : {})
+  });
+  res.end();
+});
+
 // Voice cloning endpoint
 app.post('/v1/audio/clone', upload.single('audioFile'), async (req, res) => {
   try {
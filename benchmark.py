@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Load-testing and latency benchmark for the LLM and TTS services
+Drives /generate and /tts at a configurable concurrency and arrival rate and
+reports latency percentiles, time-to-first-token/audio, tokens/s and TTS
+real-time factor. Results are saved as JSON and can be compared with a
+previous run to catch regressions.
+
+Runs against the real services, or offline against llm/simple-app.py and
+tts/mock-server.py with --spawn-mocks.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROMPT = "Tell me a brief joke about programming."
+DEFAULT_TEXT = "Thanks for calling. Please hold while we connect you to the next available agent."
+WAV_HEADER_BYTES = 44
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(values):
+    """p50/p95/p99/mean of a list of seconds, in milliseconds"""
+    if not values:
+        return None
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1)
+    }
+
+def post_json(url, payload, timeout):
+    """POST a JSON payload and return the open response"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+def run_llm_request(base_url, args, scheduled_at=None):
+    """Send one /generate request and measure latency and time to first token
+    
+    With an arrival schedule, times count from the scheduled arrival, so waiting for a free client thread
+    is part of the latency instead of being hidden (coordinated omission).
+    """
+    payload = {
+        "messages": [
+            {"role": "system", "content": "You are a helpful voice assistant."},
+            {"role": "user", "content": args.prompt}
+        ],
+        "max_tokens": args.max_tokens,
+        "temperature": args.temperature,
+        "stream": args.stream
+    }
+    result = {"ok": False, "latency": None, "ttft": None, "completion_tokens": 0}
+    start_time = scheduled_at or time.time()
+
+    try:
+        with post_json(f"{base_url}/generate", payload, args.timeout) as response:
+            if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                for line in response:
+                    line = line.decode().strip()
+                    if not line.startswith("data:") or line == "data: [DONE]":
+                        continue
+                    frame = json.loads(line[len("data:"):])
+                    if "error" in frame:
+                        raise RuntimeError(frame["error"])
+                    if frame.get("text") and result["ttft"] is None:
+                        result["ttft"] = time.time() - start_time
+                    if "usage" in frame:
+                        result["completion_tokens"] = frame["usage"].get("completion_tokens", 0)
+            else:
+                # Services without streaming: the first token arrives with the whole reply
+                body = json.loads(response.read())
+                result["ttft"] = time.time() - start_time
+                result["completion_tokens"] = body.get("usage", {}).get("completion_tokens", 0)
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["latency"] = time.time() - start_time
+    return result
+
+def run_tts_request(base_url, args, scheduled_at=None):
+    """Send one /tts request and measure latency, time to first audio and audio duration from its arrival"""
+    payload = {
+        "text": args.text,
+        "voice": args.voice,
+        "format": args.format,
+        "stream": args.stream,
+        "cache": not args.no_cache
+    }
+    result = {"ok": False, "latency": None, "ttfa": None, "audio_seconds": None}
+    header_bytes = WAV_HEADER_BYTES if args.format == "wav" else 0
+    start_time = scheduled_at or time.time()
+
+    try:
+        with post_json(f"{base_url}/tts", payload, args.timeout) as response:
+            total_bytes = 0
+            while True:
+                chunk = response.read1(65536) if hasattr(response, "read1") else response.read(65536)
+                if not chunk:
+                    break
+                total_bytes += len(chunk)
+                if result["ttfa"] is None and total_bytes > header_bytes:
+                    result["ttfa"] = time.time() - start_time
+        if args.format in ("wav", "pcm"):
+            # 16-bit mono PCM at the TTS sampling rate
+            result["audio_seconds"] = max(total_bytes - header_bytes, 0) / 2 / args.sample_rate
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["latency"] = time.time() - start_time
+    return result
+
+def run_load(name, request_fn, base_url, args):
+    """Issue requests at the configured concurrency, open-loop if an arrival rate is set"""
+    logger.info(f"Benchmarking {name} at {base_url}: {args.requests} requests, concurrency {args.concurrency}, "
+                f"{'rate ' + str(args.rate) + ' req/s' if args.rate else 'closed loop'}")
+    results = []
+    results_lock = threading.Lock()
+
+    def record(result):
+        with results_lock:
+            results.append(result)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = []
+        next_arrival = start_time
+        for _ in range(args.requests):
+            if args.rate:
+                # Poisson arrivals: exponential gaps between request start times
+                next_arrival += random.expovariate(args.rate)
+                delay = next_arrival - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(request_fn, base_url, args, next_arrival))
+            else:
+                futures.append(executor.submit(request_fn, base_url, args))
+        for future in futures:
+            record(future.result())
+    wall_seconds = time.time() - start_time
+
+    succeeded = [result for result in results if result["ok"]]
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(succeeded) / wall_seconds, 3) if wall_seconds else None,
+        "latency": summarize([result["latency"] for result in succeeded])
+    }
+
+    if name == "llm":
+        completion_tokens = sum(result["completion_tokens"] for result in succeeded)
+        summary["time_to_first_token"] = summarize([result["ttft"] for result in succeeded if result["ttft"] is not None])
+        summary["completion_tokens"] = completion_tokens
+        summary["tokens_per_second"] = round(completion_tokens / wall_seconds, 2) if wall_seconds else None
+    else:
+        audio_seconds = sum(result["audio_seconds"] or 0 for result in succeeded)
+        summary["time_to_first_audio"] = summarize([result["ttfa"] for result in succeeded if result["ttfa"] is not None])
+        summary["audio_seconds"] = round(audio_seconds, 3)
+        # Real-time factor: seconds of processing per second of audio produced (lower is better)
+        summary["real_time_factor"] = (
+            round(sum(result["latency"] for result in succeeded) / audio_seconds, 4) if audio_seconds else None
+        )
+
+    errors = [result["error"] for result in results if not result["ok"]]
+    if errors:
+        logger.warning(f"{len(errors)} {name} requests failed, first error: {errors[0]}")
+    return summary
+
+def compare_results(baseline, current):
+    """Log latency changes against a baseline run"""
+    for name in ("llm", "tts"):
+        if name not in baseline or name not in current:
+            continue
+        for metric in ("latency", "time_to_first_token", "time_to_first_audio"):
+            before = baseline[name].get(metric)
+            after = current[name].get(metric)
+            if not before or not after:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                logger.info(f"{name} {metric} {key}: {before[key]} -> {after[key]} ({change:+.1f}%)")
+
+def get_free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_health(base_url, timeout=30):
+    """Poll /health until the service answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=2):
+                return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    return False
+
+def spawn_mocks(args, processes, workdir):
+    """Start the mock LLM and TTS servers on free ports and point the benchmark at them"""
+    llm_port, tts_port = get_free_port(), get_free_port()
+    env = dict(os.environ, SERVE_PORT=str(llm_port), TTS_PORT=str(tts_port), CUSTOM_VOICES_PATH=workdir)
+
+    processes.append(subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, "llm", "simple-app.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    ))
+    processes.append(subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, "tts", "mock-server.py")],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    ))
+
+    args.llm_url = f"http://127.0.0.1:{llm_port}"
+    args.tts_url = f"http://127.0.0.1:{tts_port}"
+    for base_url in (args.llm_url, args.tts_url):
+        if not wait_for_health(base_url):
+            raise RuntimeError(f"Mock service at {base_url} did not start")
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the LLM and TTS services")
+    parser.add_argument("--target", choices=["llm", "tts", "both"], default="both")
+    parser.add_argument("--llm-url", default=os.getenv("LLM_SERVICE_URL", "http://localhost:5000"))
+    parser.add_argument("--tts-url", default=os.getenv("TTS_SERVICE_URL", "http://localhost:6000"))
+    parser.add_argument("--spawn-mocks", action="store_true", help="run against llm/simple-app.py and tts/mock-server.py")
+    parser.add_argument("--requests", type=int, default=50, help="total requests per service")
+    parser.add_argument("--concurrency", type=int, default=4, help="maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrival rate in req/s (0 = closed loop)")
+    parser.add_argument("--stream", action="store_true", help="use streaming mode to measure time to first token/audio")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--max-tokens", type=int, default=100)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--text", default=DEFAULT_TEXT)
+    parser.add_argument("--voice", default="default")
+    parser.add_argument("--format", default="wav", help="wav or pcm are needed to compute the real-time factor")
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the TTS audio cache")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def main():
+    """Main function"""
+    args = parse_args()
+    random.seed(args.seed)
+    processes = []
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            if args.spawn_mocks:
+                spawn_mocks(args, processes, workdir)
+
+            results = {
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "config": {
+                    key: value for key, value in vars(args).items()
+                    if key not in ("output", "compare")
+                }
+            }
+            if args.target in ("llm", "both"):
+                results["llm"] = run_load("llm", run_llm_request, args.llm_url, args)
+            if args.target in ("tts", "both"):
+                results["tts"] = run_load("tts", run_tts_request, args.tts_url, args)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps({key: results[key] for key in ("llm", "tts") if key in results}, indent=2))
+    logger.info(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare_results(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,36 @@
 import os
+import io
 import time
 import json
+import base64
+import hashlib
+import tempfile
 import logging
+import queue
+import socket
+import itertools
 import threading
+import multiprocessing
+from collections import OrderedDict
 import torch
 import numpy as np
+import soundfile as sf
+from math import gcd
+from scipy.signal import resample_poly
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.metrics_core import Metric
 from dotenv import load_dotenv
 from transformers import (
     AutoTokenizer, 
     BitsAndBytesConfig, 
-    TextIteratorStreamer,
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
     pipeline
 )
+from transformers.generation.streamers import BaseStreamer
 
 # Load environment variables
 load_dotenv()
@@ -30,7 +47,54 @@ MODEL_ID = os.getenv('MODEL_ID', 'fixie-ai/ultravox-v0_5-llama-3_2-1b')
 DEVICE = os.getenv('DEVICE', 'cuda' if torch.cuda.is_available() else 'cpu')
 USE_4BIT = os.getenv('USE_4BIT', 'True').lower() == 'true'
 LOAD_IN_8BIT = os.getenv('LOAD_IN_8BIT', 'False').lower() == 'true'
+if DEVICE == 'cpu' and (USE_4BIT or LOAD_IN_8BIT):
+    # bitsandbytes quantization is CUDA-only; CPU hosts load full weights and quantize with the CPU engine
+    logger.warning("USE_4BIT/LOAD_IN_8BIT ignored on CPU, loading full precision weights")
+    USE_4BIT = LOAD_IN_8BIT = False
 SERVE_PORT = int(os.getenv('SERVE_PORT', 5000))
+QUANTIZATION_MODE = "8bit" if LOAD_IN_8BIT else "4bit" if USE_4BIT else "none"
+SNAPSHOT_PATH = os.getenv('LLM_SNAPSHOT_PATH', os.path.join(
+    os.environ.get("HF_HOME", os.path.expanduser("~/.cache/huggingface")),
+    "snapshots",
+    f"{MODEL_ID.replace('/', '--')}-{QUANTIZATION_MODE}"
+))
+SNAPSHOT_MANIFEST = "snapshot.json"
+MAX_BATCH_SIZE = int(os.getenv('LLM_MAX_BATCH_SIZE', 8))
+BATCH_WINDOW_MS = float(os.getenv('LLM_BATCH_WINDOW_MS', 10))
+MAX_QUEUE_DEPTH = int(os.getenv('LLM_MAX_QUEUE_DEPTH', 64))
+RETRY_AFTER_SECONDS = int(os.getenv('LLM_RETRY_AFTER', 1))
+SERVE_MODE = os.getenv('SERVE_MODE', 'development').lower()
+SERVE_THREADS = int(os.getenv('LLM_SERVE_THREADS', 16))
+AUDIO_SAMPLING_RATE = 16000
+MAX_AUDIO_SECONDS = float(os.getenv('LLM_MAX_AUDIO_SECONDS', 120))
+KV_CACHE_MAX_BYTES = int(os.getenv('LLM_KV_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+KV_CACHE_TTL = float(os.getenv('LLM_KV_CACHE_TTL', 300))
+RESPONSE_CACHE_ENABLED = os.getenv('LLM_RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', 1024))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('LLM_RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv('LLM_RESPONSE_CACHE_TTL', 0))
+DRAFT_MODEL_ID = os.getenv('DRAFT_MODEL_ID', '')
+SPECULATIVE_BASELINE_INTERVAL = int(os.getenv('LLM_SPECULATIVE_BASELINE_INTERVAL', 20))
+CPU_ENGINE = os.getenv('CPU_ENGINE', 'eager').lower()
+CPU_THREADS = int(os.getenv('LLM_CPU_THREADS', 0))
+CPU_INTEROP_THREADS = int(os.getenv('LLM_CPU_INTEROP_THREADS', 1))
+CPU_CORES = os.getenv('LLM_CPU_CORES', '')
+CPU_COMPILE = os.getenv('LLM_CPU_COMPILE', 'False').lower() == 'true'
+CPU_ENGINE_BENCHMARK = os.getenv('CPU_ENGINE_BENCHMARK', 'True').lower() == 'true'
+CPU_BENCHMARK_TOKENS = 16
+REPLICAS = int(os.getenv('LLM_REPLICAS', 1))
+REPLICA_CONVERSATION_ROUTES = 10000
+DISCONNECT_POLL_SECONDS = 0.25
+BOOT_HEARTBEAT_SECONDS = 5
+METRICS_FORWARD_SECONDS = 5
+CONTEXT_MAX_TOKENS = int(os.getenv('LLM_CONTEXT_MAX_TOKENS', 4096))
+CONTEXT_TRIM_BLOCK_TOKENS = int(os.getenv('LLM_CONTEXT_TRIM_BLOCK_TOKENS', 512))
+CONTEXT_SUMMARY_ENABLED = os.getenv('LLM_CONTEXT_SUMMARY', 'True').lower() == 'true'
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('LLM_CONTEXT_SUMMARY_MAX_TOKENS', 200))
+CONTEXT_SUMMARY_CACHE_SIZE = 256
+TOKEN_COUNT_CACHE_SIZE = 16384
+# Chat template tokens wrapped around every message (role header and end-of-turn marker)
+MESSAGE_OVERHEAD_TOKENS = 5
 
 app = Flask(__name__)
 CORS(app)
@@ -38,8 +102,170 @@ CORS(app)
 # Global variables for model and tokenizer
 model_pipeline = None
 tokenizer = None
+startup_info = {"source": None, "load_seconds": None}
 
-def load_model():
+# Speculative decoding state; only the scheduler thread runs the models
+draft_model = None
+speculative_request = None
+speculative_stats = {
+    "requests": 0,
+    "baseline_requests": 0,
+    "draft_tokens": 0,
+    "accepted_tokens": 0,
+    "assisted_tokens_per_second": None,
+    "baseline_tokens_per_second": None
+}
+speculative_stats_lock = threading.Lock()
+
+# Inference replicas forked after loading, set only in the parent process
+replica_pool = None
+
+# Batching scheduler state
+generation_queue = queue.Queue(maxsize=MAX_QUEUE_DEPTH)
+scheduler_thread = None
+scheduler_stats = {"batches": 0, "requests": 0, "largest_batch": 0}
+scheduler_stats_lock = threading.Lock()
+
+# Prometheus metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUEUE_WAIT_SECONDS = Histogram('llm_queue_wait_seconds', 'Time requests wait for the scheduler', buckets=LATENCY_BUCKETS)
+TOKENIZATION_SECONDS = Histogram('llm_tokenization_seconds', 'Prompt preprocessing and tokenization time', buckets=LATENCY_BUCKETS)
+PREFILL_SECONDS = Histogram('llm_prefill_seconds', 'Time from batch start to the first generated token', buckets=LATENCY_BUCKETS)
+DECODE_SECONDS = Histogram('llm_decode_seconds', 'Time from the first generated token to completion', buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram('llm_request_duration_seconds', 'End-to-end generation time', buckets=LATENCY_BUCKETS)
+BATCH_SIZE = Histogram('llm_batch_size', 'Requests per generate() call', buckets=(1, 2, 4, 8, 16, 32, 64))
+REQUESTS_IN_FLIGHT = Gauge('llm_requests_in_flight', 'Generation requests queued or running')
+QUEUE_DEPTH = Gauge('llm_queue_depth', 'Requests waiting for the scheduler, or dispatched to the replicas')
+MODEL_MEMORY_BYTES = Gauge('llm_model_memory_bytes', 'Memory footprint of the loaded model weights')
+DEVICE_MEMORY_BYTES = Gauge('llm_device_memory_allocated_bytes', 'CUDA memory currently allocated by the process')
+REQUESTS_TOTAL = Counter('llm_requests_total', 'Finished generation requests', ['finish_reason'])
+COMPLETION_TOKENS_TOTAL = Counter('llm_completion_tokens_total', 'Generated completion tokens')
+KV_CACHE_LOOKUPS_TOTAL = Counter('llm_kv_cache_lookups_total', 'Conversation KV cache lookups', ['result'])
+REJECTED_TOTAL = Counter('llm_rejected_requests_total', 'Requests rejected because the queue was full')
+INTERRUPTED_TOTAL = Counter('llm_interrupted_requests_total', 'Requests stopped because the client left or the deadline passed', ['reason', 'stage'])
+RESPONSE_CACHE_LOOKUPS_TOTAL = Counter('llm_response_cache_lookups_total', 'Deterministic response cache lookups', ['result'])
+REPLICA_IN_FLIGHT = Gauge('llm_replica_requests_in_flight', 'Requests dispatched to each inference replica', ['replica'])
+DRAFT_TOKENS_TOTAL = Counter('llm_speculative_draft_tokens_total', 'Tokens proposed by the draft model')
+ACCEPTED_TOKENS_TOTAL = Counter('llm_speculative_accepted_tokens_total', 'Draft tokens accepted by the main model')
+ACCEPTANCE_RATE = Histogram('llm_speculative_acceptance_rate', 'Fraction of draft tokens accepted per request', buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+TOKENS_PER_SECOND = Histogram('llm_generation_tokens_per_second', 'Completion tokens per second of single-request generations', ['mode'], buckets=(5, 10, 20, 40, 80, 160, 320, 640))
+SPECULATIVE_SPEEDUP = Gauge('llm_speculative_speedup', 'Average assisted tokens/s over average baseline tokens/s')
+CONTEXT_TRIMMED_TOTAL = Counter('llm_context_trimmed_requests_total', 'Requests whose oldest turns were dropped to fit the context budget')
+CONTEXT_DROPPED_TURNS_TOTAL = Counter('llm_context_dropped_turns_total', 'Conversation turns dropped to fit the context budget')
+CONTEXT_SUMMARY_LOOKUPS_TOTAL = Counter('llm_context_summary_lookups_total', 'Summary lookups for dropped turns', ['result'])
+
+MODEL_MEMORY_BYTES.set_function(lambda: (
+    (model_pipeline.model.get_memory_footprint() if model_pipeline is not None else 0)
+    + (draft_model.get_memory_footprint() if draft_model is not None else 0)
+))
+SPECULATIVE_SPEEDUP.set_function(lambda: get_speculative_speedup() or 0.0)
+DEVICE_MEMORY_BYTES.set_function(lambda: torch.cuda.memory_allocated() if torch.cuda.is_available() else 0)
+
+# Per-conversation KV caches, least recently used first
+conversation_cache = OrderedDict()
+conversation_cache_bytes = 0
+conversation_cache_lock = threading.Lock()
+conversation_cache_stats = {"hits": 0, "misses": 0, "reused_tokens": 0}
+
+# Responses of greedy requests, least recently used first: key -> (stored_at, size, response)
+response_cache = OrderedDict()
+response_cache_bytes = 0
+response_cache_lock = threading.Lock()
+response_cache_stats = {"hits": 0, "misses": 0}
+
+# Token counts of message contents by digest, least recently used first
+token_count_cache = OrderedDict()
+token_count_lock = threading.Lock()
+
+# Summaries of dropped conversation prefixes by prefix digest, least recently used first
+context_summaries = OrderedDict()
+context_summary_jobs = set()
+context_lock = threading.Lock()
+context_stats = {"trimmed_requests": 0, "dropped_turns": 0, "summary_hits": 0, "summaries_generated": 0}
+
+def read_snapshot_manifest():
+    """Read the manifest of the compiled snapshot, or None if there is no snapshot"""
+    manifest_path = os.path.join(SNAPSHOT_PATH, SNAPSHOT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def load_snapshot():
+    """Load the pre-quantized snapshot; safetensors are memory-mapped and paged in lazily"""
+    global model_pipeline, tokenizer
+    
+    logger.info(f"Loading pre-quantized snapshot: {SNAPSHOT_PATH}")
+    model_pipeline = pipeline(
+        model=SNAPSHOT_PATH,
+        device_map="auto" if DEVICE == "cuda" else DEVICE,
+        trust_remote_code=True,
+        # The quantization config is stored in the snapshot's config.json
+        model_kwargs={"use_safetensors": True, "low_cpu_mem_usage": True, "local_files_only": True},
+        torch_dtype=torch.bfloat16 if DEVICE == "cuda" else torch.float32,
+        local_files_only=True,
+    )
+    tokenizer = model_pipeline.tokenizer
+
+def save_snapshot():
+    """Save the loaded, quantized model as a self-contained safetensors snapshot"""
+    model = model_pipeline.model
+    os.makedirs(SNAPSHOT_PATH, exist_ok=True)
+    
+    # Ultravox normally saves only its projector and reloads the text and audio towers by id;
+    # store every weight and drop the ids so the snapshot loads without touching the hub cache
+    text_model_id = getattr(model.config, "text_model_id", None)
+    audio_model_id = getattr(model.config, "audio_model_id", None)
+    model.config.text_model_id = None
+    model.config.audio_model_id = None
+    try:
+        model.save_pretrained(
+            SNAPSHOT_PATH,
+            state_dict=torch.nn.Module.state_dict(model),
+            safe_serialization=True
+        )
+    finally:
+        model.config.text_model_id = text_model_id
+        model.config.audio_model_id = audio_model_id
+    
+    processor = getattr(model_pipeline, "processor", None)
+    if processor is not None:
+        processor.save_pretrained(SNAPSHOT_PATH)
+    tokenizer.save_pretrained(SNAPSHOT_PATH)
+    
+    # The manifest is written last so a partial snapshot is never picked up
+    with open(os.path.join(SNAPSHOT_PATH, SNAPSHOT_MANIFEST), 'w') as f:
+        json.dump({
+            "model_id": MODEL_ID,
+            "quantization": QUANTIZATION_MODE,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }, f)
+    logger.info(f"Saved snapshot of {MODEL_ID} ({QUANTIZATION_MODE}) to {SNAPSHOT_PATH}")
+
+def load_model(use_snapshot=True):
+    """Load the LLM model, from the compiled snapshot when one matches the configuration"""
+    start_time = time.time()
+    
+    manifest = read_snapshot_manifest() if use_snapshot else None
+    if manifest is not None:
+        if manifest.get("model_id") == MODEL_ID and manifest.get("quantization") == QUANTIZATION_MODE:
+            try:
+                load_snapshot()
+                startup_info["source"] = "snapshot"
+                startup_info["load_seconds"] = round(time.time() - start_time, 3)
+                logger.info(f"Model loaded from snapshot in {startup_info['load_seconds']}s")
+                return
+            except Exception as e:
+                logger.error(f"Error loading snapshot, falling back to the model cache: {str(e)}")
+        else:
+            logger.warning(f"Snapshot at {SNAPSHOT_PATH} was compiled for {manifest.get('model_id')} ({manifest.get('quantization')}), ignoring it")
+    
+    load_model_from_cache()
+    startup_info["source"] = "cache"
+    startup_info["load_seconds"] = round(time.time() - start_time, 3)
+    logger.info(f"Model loaded in {startup_info['load_seconds']}s")
+
+def load_model_from_cache():
     """Load the LLM model using the pipeline for Ultravox support"""
     global model_pipeline, tokenizer
     
@@ -101,6 +327,155 @@ def load_model():
         logger.error(f"Error loading model: {str(e)}")
         raise
 
+def parse_cpu_list(spec):
+    """Parse a core list such as "0-3,8" into a set of core ids"""
+    cores = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cores.update(range(int(first), int(last) + 1))
+        else:
+            cores.add(int(part))
+    return cores
+
+def get_worker_cores(worker_index):
+    """Cores a worker is pinned to: its group from LLM_CPU_CORES, or an even share of the cores when replicated"""
+    if CPU_CORES:
+        # Core groups are separated by ';', worker N is pinned to group N
+        groups = [group for group in CPU_CORES.split(';') if group.strip()]
+        return parse_cpu_list(groups[worker_index % len(groups)])
+    if REPLICAS > 1:
+        available = sorted(os.sched_getaffinity(0))
+        share = max(1, len(available) // REPLICAS)
+        return set(available[worker_index * share:(worker_index + 1) * share] or available)
+    return None
+
+def configure_cpu_runtime(worker_index=0):
+    """Pin the process to its cores and size the torch thread pools; must run before the model is used"""
+    if DEVICE != 'cpu':
+        return
+    
+    cpu_info = {"engine": CPU_ENGINE, "cores": None}
+    cores = get_worker_cores(worker_index) if worker_index is not None and hasattr(os, "sched_setaffinity") else None
+    if cores:
+        os.sched_setaffinity(0, cores)
+        cpu_info["cores"] = sorted(cores)
+    
+    # One intra-op thread per usable core unless set explicitly
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(CPU_THREADS or available)
+    try:
+        torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+    except RuntimeError:
+        logger.warning("Inter-op thread pool already started, keeping its size")
+    
+    cpu_info["threads"] = torch.get_num_threads()
+    cpu_info["interop_threads"] = torch.get_num_interop_threads()
+    startup_info["cpu"] = cpu_info
+    logger.info(f"CPU runtime: {cpu_info['threads']} threads, {cpu_info['interop_threads']} inter-op threads, cores {cpu_info['cores'] or 'all'}")
+
+def measure_generation_latency(runs=2):
+    """Best wall time of a short fixed-length greedy generation, in milliseconds"""
+    model_inputs = prepare_model_inputs([{"role": "user", "content": "Say hello."}])
+    generation_kwargs = dict(get_generation_kwargs(CPU_BENCHMARK_TOKENS, 0.0), min_new_tokens=CPU_BENCHMARK_TOKENS)
+    
+    best = None
+    for _ in range(runs):
+        start_time = time.time()
+        with torch.inference_mode():
+            model_pipeline.model.generate(**model_inputs, **generation_kwargs)
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 1)
+
+def run_compile_warmup(model):
+    """Generate a couple of tokens with a model, which is when a compiled graph is actually built"""
+    model_inputs = prepare_model_inputs([{"role": "user", "content": "Say hello."}])
+    if model is not model_pipeline.model:
+        # The draft model is a plain text model and only takes the token ids
+        model_inputs = {key: model_inputs[key] for key in ("input_ids", "attention_mask") if key in model_inputs}
+    with torch.inference_mode():
+        model.generate(**model_inputs, **get_generation_kwargs(2, 0.0))
+
+def optimize_cpu_model(model):
+    """Quantize linear layers to int8 with dynamic activation scales, optionally compiling the graph
+    
+    Returns whether the model runs compiled.
+    """
+    torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if not CPU_COMPILE:
+        return False
+    try:
+        model.compile(dynamic=True)
+        # compile() only installs a lazy wrapper; Dynamo and Inductor errors surface on the first call
+        run_compile_warmup(model)
+    except Exception as e:
+        model._compiled_call_impl = None
+        logger.warning(f"Graph compilation failed, running eagerly: {str(e)}")
+        return False
+    return True
+
+def apply_cpu_engine():
+    """Switch the loaded models to the optimized CPU engine and compare latency with the eager path"""
+    if DEVICE != 'cpu' or CPU_ENGINE != 'optimized':
+        return
+    
+    cpu_info = startup_info.setdefault("cpu", {"engine": CPU_ENGINE})
+    if CPU_ENGINE_BENCHMARK:
+        cpu_info["eager_ms"] = measure_generation_latency()
+    
+    start_time = time.time()
+    compiled = optimize_cpu_model(model_pipeline.model)
+    if draft_model is not None:
+        compiled = optimize_cpu_model(draft_model) and compiled
+    cpu_info["optimize_seconds"] = round(time.time() - start_time, 3)
+    cpu_info["compiled"] = compiled
+    
+    if CPU_ENGINE_BENCHMARK:
+        # Compilation already happened in the warmup, the best of the runs still smooths out noise
+        cpu_info["optimized_ms"] = measure_generation_latency()
+        cpu_info["speedup"] = round(cpu_info["eager_ms"] / cpu_info["optimized_ms"], 2)
+        logger.info(f"CPU engine: {CPU_BENCHMARK_TOKENS} tokens in {cpu_info['optimized_ms']}ms (eager {cpu_info['eager_ms']}ms, {cpu_info['speedup']}x)")
+    else:
+        logger.info("CPU engine: int8 dynamic quantization applied")
+
+def count_draft_forward(module, inputs, output):
+    """Forward hook on the draft model; every draft forward pass proposes one token"""
+    if speculative_request is not None:
+        speculative_request.draft_tokens += 1
+
+def load_draft_model():
+    """Load the draft model for assisted generation, leaving speculation off if it can't be used"""
+    global draft_model
+    
+    if not DRAFT_MODEL_ID:
+        return
+    
+    logger.info(f"Loading draft model: {DRAFT_MODEL_ID}")
+    try:
+        draft_pipeline = pipeline(
+            model=DRAFT_MODEL_ID,
+            device_map="auto" if DEVICE == "cuda" else DEVICE,
+            trust_remote_code=True,
+            torch_dtype=torch.bfloat16 if DEVICE == "cuda" else torch.float32,
+            local_files_only=True,
+        )
+    except Exception as e:
+        logger.error(f"Error loading draft model, speculative decoding disabled: {str(e)}")
+        return
+    
+    # Assisted generation verifies draft token ids directly, so both models must share a vocabulary
+    if draft_pipeline.tokenizer.get_vocab() != tokenizer.get_vocab():
+        logger.error(f"Draft model {DRAFT_MODEL_ID} does not share the tokenizer of {MODEL_ID}, speculative decoding disabled")
+        return
+    
+    draft_model = draft_pipeline.model
+    draft_model.register_forward_hook(count_draft_forward)
+    logger.info(f"Speculative decoding enabled with draft model {DRAFT_MODEL_ID}")
+
 def format_chat_prompt(messages):
     """Format chat messages into prompt format expected by the model"""
     turns = []
@@ -118,23 +493,1242 @@ def format_chat_prompt(messages):
     return turns
 
 def count_tokens(text):
-    """Count the number of tokens in the text"""
+    """Count the number of tokens in the text, caching counts by content digest"""
     global tokenizer
     if tokenizer is None:
         return 0
-    return len(tokenizer.encode(text))
+    
+    key = hashlib.sha1(text.encode()).digest()
+    with token_count_lock:
+        count = token_count_cache.get(key)
+        if count is not None:
+            token_count_cache.move_to_end(key)
+            return count
+    
+    count = len(tokenizer.encode(text, add_special_tokens=False))
+    with token_count_lock:
+        token_count_cache[key] = count
+        while len(token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+            token_count_cache.popitem(last=False)
+    return count
+
+def count_turn_tokens(turn):
+    """Tokens a chat turn occupies in the prompt, including the template around it"""
+    content = turn["content"] if isinstance(turn["content"], str) else json.dumps(turn["content"])
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+def truncate_to_tokens(text, max_tokens):
+    """Keep the last max_tokens tokens of the text"""
+    token_ids = tokenizer.encode(text, add_special_tokens=False)
+    if len(token_ids) <= max_tokens:
+        return text
+    return tokenizer.decode(token_ids[-max_tokens:]) if max_tokens > 0 else ""
+
+def get_prefix_keys(turns):
+    """Rolling digests of every prefix of the turns, so a longer history extends the keys of a shorter one"""
+    keys = []
+    digest = b""
+    for turn in turns:
+        digest = hashlib.sha256(digest + json.dumps([turn["role"], turn["content"]]).encode()).digest()
+        keys.append(digest)
+    return keys
+
+def summarize_dropped_turns(key, previous_summary, turns):
+    """Generate a summary of dropped turns in the background and cache it under the prefix digest"""
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    if previous_summary:
+        transcript = f"Summary of the conversation before this: {previous_summary}\n{transcript}"
+    # The summarization prompt must itself fit the budget
+    transcript = truncate_to_tokens(transcript, CONTEXT_MAX_TOKENS - 2 * CONTEXT_SUMMARY_MAX_TOKENS)
+    summary_turns = [
+        {"role": "system", "content": "Summarize the conversation below in a few sentences. Keep names, facts, decisions and open questions."},
+        {"role": "user", "content": transcript}
+    ]
+    
+    try:
+        summary = wait_for_generation(submit_generation(summary_turns, CONTEXT_SUMMARY_MAX_TOKENS, 0.0)).strip()
+    except queue.Full:
+        # Leave it to a later request once the server is less busy
+        summary = None
+    except Exception as e:
+        logger.error(f"Error summarizing conversation: {str(e)}")
+        summary = None
+    
+    with context_lock:
+        context_summary_jobs.discard(key)
+        if summary:
+            context_summaries[key] = summary
+            context_stats["summaries_generated"] += 1
+            while len(context_summaries) > CONTEXT_SUMMARY_CACHE_SIZE:
+                context_summaries.popitem(last=False)
+
+def get_context_summary(dropped_turns):
+    """Cached summary of the dropped turns, scheduling one if missing; may cover only an older prefix"""
+    keys = get_prefix_keys(dropped_turns)
+    with context_lock:
+        if keys[-1] in context_summaries:
+            context_summaries.move_to_end(keys[-1])
+            context_stats["summary_hits"] += 1
+            CONTEXT_SUMMARY_LOOKUPS_TOTAL.labels(result="hit").inc()
+            return context_summaries[keys[-1]]
+        
+        # Fall back to the summary of the longest shorter prefix and extend it in the background
+        base_index, base_summary = -1, None
+        for index in range(len(keys) - 2, -1, -1):
+            if keys[index] in context_summaries:
+                base_index, base_summary = index, context_summaries[keys[index]]
+                break
+        CONTEXT_SUMMARY_LOOKUPS_TOTAL.labels(result="stale" if base_summary else "miss").inc()
+        if keys[-1] in context_summary_jobs:
+            return base_summary
+        context_summary_jobs.add(keys[-1])
+    
+    threading.Thread(
+        target=summarize_dropped_turns,
+        args=(keys[-1], base_summary, dropped_turns[base_index + 1:]),
+        name="context-summary",
+        daemon=True
+    ).start()
+    return base_summary
+
+def fit_context(turns, max_tokens):
+    """Keep the system prompt and the newest turns within the context budget, summarizing older turns
+    
+    Raises ValueError when max_tokens and the system prompt leave no room for the conversation.
+    """
+    if CONTEXT_MAX_TOKENS <= 0 or tokenizer is None:
+        return turns
+    
+    head = 0
+    while head < len(turns) and turns[head]["role"] == "system":
+        head += 1
+    system_turns, history = turns[:head], turns[head:]
+    counts = [count_turn_tokens(turn) for turn in history]
+    available = CONTEXT_MAX_TOKENS - max_tokens - sum(count_turn_tokens(turn) for turn in system_turns)
+    total = sum(counts)
+    if total <= available or not history:
+        return turns
+    if available <= MESSAGE_OVERHEAD_TOKENS:
+        raise ValueError(
+            f"max_tokens of {max_tokens} leaves no room for the messages in the {CONTEXT_MAX_TOKENS}-token context"
+        )
+    # A summary only gets its reserved space if the newest turn still has room next to it
+    summarize = CONTEXT_SUMMARY_ENABLED and available - CONTEXT_SUMMARY_MAX_TOKENS - MESSAGE_OVERHEAD_TOKENS > MESSAGE_OVERHEAD_TOKENS
+    if summarize:
+        available -= CONTEXT_SUMMARY_MAX_TOKENS + MESSAGE_OVERHEAD_TOKENS
+    
+    # Cut only at fixed token checkpoints counted from the start of the history, so the kept prefix
+    # stays the same for several turns and both the KV cache and the summary cache keep hitting
+    cut, dropped, checkpoint = 0, 0, 0
+    while cut < len(history) - 1 and total - dropped > available:
+        checkpoint += CONTEXT_TRIM_BLOCK_TOKENS
+        while cut < len(history) - 1 and dropped < checkpoint:
+            dropped += counts[cut]
+            cut += 1
+    # Resume the kept history on a user turn
+    while cut < len(history) - 1 and history[cut]["role"] != "user":
+        dropped += counts[cut]
+        cut += 1
+    
+    kept = history[cut:]
+    if total - dropped > available and isinstance(kept[-1]["content"], str):
+        # The newest turn alone is over budget: keep its end, which is what the user said last
+        kept = [{**kept[-1], "content": truncate_to_tokens(kept[-1]["content"], max(available - MESSAGE_OVERHEAD_TOKENS, 0))}]
+        cut = len(history) - 1
+    
+    with context_lock:
+        context_stats["trimmed_requests"] += 1
+        context_stats["dropped_turns"] += cut
+    CONTEXT_TRIMMED_TOTAL.inc()
+    CONTEXT_DROPPED_TURNS_TOTAL.inc(cut)
+    
+    summary = get_context_summary(history[:cut]) if summarize and cut else None
+    if summary:
+        system_turns = system_turns + [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}]
+    return system_turns + kept
+
+def parse_flag(value):
+    """Interpret a JSON boolean or a form field string as a flag"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+def resample_to_model_rate(audio, sample_rate):
+    """Resample audio to the 16 kHz expected by the Whisper encoder with a polyphase filter"""
+    if sample_rate == AUDIO_SAMPLING_RATE:
+        return audio
+    divisor = gcd(int(sample_rate), AUDIO_SAMPLING_RATE)
+    return resample_poly(audio, AUDIO_SAMPLING_RATE // divisor, int(sample_rate) // divisor).astype(np.float32)
+
+def decode_audio_file(audio_bytes):
+    """Decode an uploaded audio file to mono float32 at the model sampling rate"""
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype='float32', always_2d=True)
+        audio = audio.mean(axis=1)
+    except Exception:
+        # Containers libsndfile can't parse (e.g. browser webm recordings) go through librosa/ffmpeg
+        import librosa
+        with tempfile.NamedTemporaryFile() as temp_file:
+            temp_file.write(audio_bytes)
+            temp_file.flush()
+            audio, sample_rate = librosa.load(temp_file.name, sr=None, mono=True)
+    return resample_to_model_rate(audio.astype(np.float32), sample_rate)
+
+def decode_pcm16(encoded_audio, sample_rate):
+    """Decode base64 little-endian 16-bit mono PCM to float32 at the model sampling rate"""
+    pcm = np.frombuffer(base64.b64decode(encoded_audio), dtype='<i2')
+    return resample_to_model_rate(pcm.astype(np.float32) / 32768.0, sample_rate)
+
+def attach_audio_placeholder(turns):
+    """Make sure the user turn that carries the audio references it"""
+    if turns and turns[-1]["role"] == "user" and "<|audio|>" not in turns[-1]["content"]:
+        turns[-1]["content"] = f"{turns[-1]['content']} <|audio|>".strip()
+    return turns
+
+def prepare_model_inputs(turns, audio=None):
+    """Run the pipeline preprocessing for a single conversation, leaving tensors on the CPU"""
+    inputs = {"turns": turns}
+    if audio is not None:
+        # Without a trailing user turn the pipeline appends one holding the audio
+        inputs["audio"] = audio
+        inputs["sampling_rate"] = AUDIO_SAMPLING_RATE
+    
+    model_inputs = model_pipeline.preprocess(inputs)
+    if "audio_values" in model_inputs:
+        model_inputs["audio_values"] = model_inputs["audio_values"].to(dtype=model_pipeline.model.dtype)
+    return model_inputs
+
+def get_terminators():
+    """Token ids that end a completion"""
+    terminators = [tokenizer.eos_token_id]
+    eot_id = tokenizer.convert_tokens_to_ids("<|eot_id|>")
+    if eot_id is not None and eot_id != tokenizer.unk_token_id:
+        terminators.append(eot_id)
+    return terminators
+
+def get_pad_token_id():
+    """Token id used to left-pad batched prompts"""
+    return tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+def get_generation_kwargs(max_tokens, temperature):
+    """Build the generate() arguments used by the Ultravox pipeline"""
+    generation_kwargs = {
+        "max_new_tokens": max_tokens,
+        "do_sample": temperature > 0,
+        "eos_token_id": get_terminators(),
+        "pad_token_id": get_pad_token_id(),
+    }
+    if temperature > 0:
+        generation_kwargs["temperature"] = temperature
+    return generation_kwargs
+
+def sse_event(payload):
+    """Format a payload as a server-sent event frame"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+class GenerationRequest:
+    """A queued generation request; decoded text and the final result are pushed to `events`"""
+    
+    def __init__(self, model_inputs, max_tokens, temperature, conversation_id=None, deadline=None):
+        self.model_inputs = model_inputs
+        self.conversation_id = conversation_id
+        self.cached_tokens = 0
+        self.prompt_tokens = int(model_inputs["input_ids"].shape[1])
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.token_ids = []
+        self.sent_text_len = 0
+        self.finish_reason = None
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.speculative = False
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self.deadline = deadline
+        self.cancelled = False
+        self.events = queue.Queue()
+    
+    @property
+    def batchable(self):
+        # Requests carrying audio features or a conversation KV cache are run on their own
+        return self.conversation_id is None and set(self.model_inputs) <= {"input_ids", "attention_mask"}
+    
+    def add_token(self, token_id):
+        """Record a generated token and emit any newly decoded text"""
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+        self.token_ids.append(token_id)
+        text = tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        # Hold back incomplete multi-byte characters until the next token completes them
+        if text.endswith("\ufffd"):
+            return
+        if len(text) > self.sent_text_len:
+            self.events.put(("text", text[self.sent_text_len:]))
+            self.sent_text_len = len(text)
+    
+    def finish(self, finish_reason):
+        if self.finish_reason is None:
+            self.finish_reason = finish_reason
+            self.finished_at = time.time()
+            self.observe_metrics()
+            self.events.put(("done", finish_reason))
+    
+    def fail(self, error):
+        if self.finish_reason is None:
+            self.finish_reason = "error"
+            self.finished_at = time.time()
+            self.observe_metrics()
+            self.events.put(("error", error))
+    
+    def cancel(self):
+        """Ask the scheduler to stop the request at its next decode step"""
+        self.cancelled = True
+    
+    def check_interrupted(self):
+        """Finish the request if its client left or its deadline passed; True once it has finished"""
+        if self.finish_reason is None:
+            if self.cancelled:
+                self.finish("cancelled")
+            elif self.deadline is not None and time.time() >= self.deadline:
+                self.finish("timeout")
+        return self.finish_reason is not None
+    
+    def observe_metrics(self):
+        """Record per-stage timings once the request has finished"""
+        REQUESTS_IN_FLIGHT.dec()
+        REQUESTS_TOTAL.labels(self.finish_reason).inc()
+        if self.finish_reason in ("cancelled", "timeout"):
+            INTERRUPTED_TOTAL.labels(self.finish_reason, "queued" if self.started_at is None else "running").inc()
+        COMPLETION_TOKENS_TOTAL.inc(len(self.token_ids))
+        REQUEST_SECONDS.observe(self.finished_at - self.enqueued_at)
+        if self.started_at is not None:
+            QUEUE_WAIT_SECONDS.observe(self.started_at - self.enqueued_at)
+            if self.first_token_at is not None:
+                PREFILL_SECONDS.observe(self.first_token_at - self.started_at)
+                DECODE_SECONDS.observe(self.finished_at - self.first_token_at)
+    
+    def timing(self):
+        """Time spent waiting for the scheduler and time spent in the model, in milliseconds"""
+        started_at = self.started_at or self.enqueued_at
+        finished_at = self.finished_at or time.time()
+        return {
+            "queue_ms": round((started_at - self.enqueued_at) * 1000, 1),
+            "inference_ms": round((finished_at - started_at) * 1000, 1)
+        }
+    
+    def tokens_per_second(self):
+        if not self.token_ids or self.started_at is None or self.finished_at <= self.started_at:
+            return None
+        return len(self.token_ids) / (self.finished_at - self.started_at)
+    
+    def speculation(self):
+        """Acceptance rate and speed-up of an assisted generation, or None if no draft model was used"""
+        if not self.speculative:
+            return None
+        tokens_per_second = self.tokens_per_second()
+        with speculative_stats_lock:
+            baseline = speculative_stats["baseline_tokens_per_second"]
+        return {
+            "draft_tokens": self.draft_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "acceptance_rate": round(self.accepted_tokens / self.draft_tokens, 3) if self.draft_tokens else None,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second else None,
+            "speedup": round(tokens_per_second / baseline, 2) if tokens_per_second and baseline else None
+        }
+    
+    def usage(self):
+        completion_tokens = len(self.token_ids)
+        usage = {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": self.prompt_tokens + completion_tokens
+        }
+        if self.conversation_id is not None:
+            usage["cached_tokens"] = self.cached_tokens
+        return usage
+
+class BatchStreamer(BaseStreamer):
+    """Routes the tokens generated for each row of a batch to its own request"""
+    
+    def __init__(self, requests):
+        self.requests = requests
+        self.terminators = set(get_terminators())
+        self.prompt_seen = False
+    
+    def put(self, value):
+        # generate() first passes the prompt ids, which are not part of the completion
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        
+        # Assisted generation puts every accepted draft token plus the main model's own token at once
+        for row, token_ids in enumerate(value.reshape(len(self.requests), -1).tolist()):
+            generation_request = self.requests[row]
+            if generation_request.speculative:
+                generation_request.accepted_tokens += len(token_ids) - 1
+            for token_id in token_ids:
+                if generation_request.finish_reason is not None:
+                    break
+                if token_id in self.terminators:
+                    generation_request.finish("stop")
+                    break
+                generation_request.add_token(token_id)
+                if len(generation_request.token_ids) >= generation_request.max_tokens:
+                    generation_request.finish("length")
+    
+    def end(self):
+        for generation_request in self.requests:
+            generation_request.finish(
+                "length" if len(generation_request.token_ids) >= generation_request.max_tokens else "stop"
+            )
+    
+    def finished_rows(self, device):
+        # Checked at every decode step, so hung-up and overdue requests stop within one token
+        return torch.tensor(
+            [generation_request.check_interrupted() for generation_request in self.requests],
+            dtype=torch.bool,
+            device=device
+        )
+
+class BatchFinishedCriteria(StoppingCriteria):
+    """Stops each row once its request has finished, even if others in the batch continue"""
+    
+    def __init__(self, streamer):
+        self.streamer = streamer
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.streamer.finished_rows(input_ids.device)
+
+def collate_model_inputs(requests):
+    """Left-pad the prompts of several requests into a single batch"""
+    if len(requests) == 1:
+        return dict(requests[0].model_inputs)
+    
+    max_len = max(generation_request.prompt_tokens for generation_request in requests)
+    input_ids = torch.full((len(requests), max_len), get_pad_token_id(), dtype=torch.long)
+    attention_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+    
+    for row, generation_request in enumerate(requests):
+        length = generation_request.prompt_tokens
+        input_ids[row, max_len - length:] = generation_request.model_inputs["input_ids"][0]
+        if "attention_mask" in generation_request.model_inputs:
+            attention_mask[row, max_len - length:] = generation_request.model_inputs["attention_mask"][0]
+        else:
+            attention_mask[row, max_len - length:] = 1
+    
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+def get_cache_nbytes(cache):
+    """Device memory held by a KV cache"""
+    if hasattr(cache, "layers"):
+        tensors = [tensor for layer in cache.layers for tensor in (layer.keys, layer.values) if tensor is not None]
+    else:
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+def get_common_prefix_length(cached_ids, input_ids):
+    """Number of leading tokens two id sequences share"""
+    length = min(len(cached_ids), len(input_ids))
+    mismatches = (cached_ids[:length] != input_ids[:length]).nonzero()
+    return int(mismatches[0]) if len(mismatches) else length
+
+def evict_conversation_caches():
+    """Drop expired conversation caches and trim the rest to the memory budget; caller holds the lock"""
+    global conversation_cache_bytes
+    
+    now = time.time()
+    while conversation_cache:
+        conversation_id, entry = next(iter(conversation_cache.items()))
+        if now - entry["last_used"] < KV_CACHE_TTL and conversation_cache_bytes <= KV_CACHE_MAX_BYTES:
+            break
+        conversation_cache.popitem(last=False)
+        conversation_cache_bytes -= entry["bytes"]
+
+def checkout_conversation_cache(generation_request):
+    """Take a conversation's cached prefix, cropped to the part that still matches the new prompt"""
+    global conversation_cache_bytes
+    
+    with conversation_cache_lock:
+        evict_conversation_caches()
+        # The entry is removed while in use so concurrent turns never share a cache
+        entry = conversation_cache.pop(generation_request.conversation_id, None)
+        if entry is not None:
+            conversation_cache_bytes -= entry["bytes"]
+    
+    input_ids = generation_request.model_inputs["input_ids"][0]
+    prefix_len = 0
+    if entry is not None:
+        # At least one prompt token has to go through the model to produce the next-token logits
+        prefix_len = min(get_common_prefix_length(entry["token_ids"], input_ids), len(input_ids) - 1)
+    
+    with conversation_cache_lock:
+        if prefix_len > 0:
+            conversation_cache_stats["hits"] += 1
+            conversation_cache_stats["reused_tokens"] += prefix_len
+        else:
+            conversation_cache_stats["misses"] += 1
+    KV_CACHE_LOOKUPS_TOTAL.labels("hit" if prefix_len > 0 else "miss").inc()
+    
+    if prefix_len <= 0:
+        return DynamicCache()
+    
+    cache = entry["cache"]
+    if prefix_len < cache.get_seq_length():
+        # History diverged (edited or re-rendered turns), keep only the matching prefix
+        cache.crop(prefix_len)
+    generation_request.cached_tokens = prefix_len
+    return cache
+
+def store_conversation_cache(generation_request, cache, sequences):
+    """Keep the KV cache of a finished turn for the conversation's next request"""
+    global conversation_cache_bytes
+    
+    cached_len = cache.get_seq_length()
+    nbytes = get_cache_nbytes(cache)
+    if cached_len == 0 or nbytes > KV_CACHE_MAX_BYTES:
+        return
+    
+    with conversation_cache_lock:
+        previous = conversation_cache.pop(generation_request.conversation_id, None)
+        if previous is not None:
+            conversation_cache_bytes -= previous["bytes"]
+        conversation_cache[generation_request.conversation_id] = {
+            "cache": cache,
+            "token_ids": sequences[0][:cached_len].cpu(),
+            "bytes": nbytes,
+            "last_used": time.time()
+        }
+        conversation_cache_bytes += nbytes
+        evict_conversation_caches()
+
+def get_speculative_speedup():
+    """Average assisted tokens/s over average baseline tokens/s, or None until both are known"""
+    with speculative_stats_lock:
+        assisted = speculative_stats["assisted_tokens_per_second"]
+        baseline = speculative_stats["baseline_tokens_per_second"]
+    if not assisted or not baseline:
+        return None
+    return assisted / baseline
+
+def is_speculation_eligible(requests):
+    """Assisted generation only supports one sequence, and the draft never sees audio features"""
+    return (
+        draft_model is not None
+        and len(requests) == 1
+        and set(requests[0].model_inputs) <= {"input_ids", "attention_mask"}
+    )
+
+def use_speculative_decoding(requests):
+    """Whether a batch runs with the draft model; every Nth eligible request runs without it as a baseline"""
+    if not is_speculation_eligible(requests):
+        return False
+    
+    with speculative_stats_lock:
+        eligible = speculative_stats["requests"] + speculative_stats["baseline_requests"]
+        if SPECULATIVE_BASELINE_INTERVAL > 0 and eligible % SPECULATIVE_BASELINE_INTERVAL == 0:
+            speculative_stats["baseline_requests"] += 1
+            return False
+        speculative_stats["requests"] += 1
+    return True
+
+def update_average(average, value, weight=0.1):
+    """Exponential moving average that starts at the first value"""
+    return value if average is None else average + weight * (value - average)
+
+def record_speculation(generation_request, speculative):
+    """Update acceptance and tokens/s statistics after a single-request generation"""
+    tokens_per_second = generation_request.tokens_per_second()
+    
+    with speculative_stats_lock:
+        if speculative:
+            speculative_stats["draft_tokens"] += generation_request.draft_tokens
+            speculative_stats["accepted_tokens"] += generation_request.accepted_tokens
+        if tokens_per_second:
+            key = "assisted_tokens_per_second" if speculative else "baseline_tokens_per_second"
+            speculative_stats[key] = update_average(speculative_stats[key], tokens_per_second)
+    
+    if speculative:
+        DRAFT_TOKENS_TOTAL.inc(generation_request.draft_tokens)
+        ACCEPTED_TOKENS_TOTAL.inc(generation_request.accepted_tokens)
+        if generation_request.draft_tokens:
+            ACCEPTANCE_RATE.observe(generation_request.accepted_tokens / generation_request.draft_tokens)
+    if tokens_per_second:
+        TOKENS_PER_SECOND.labels("assisted" if speculative else "baseline").observe(tokens_per_second)
+
+def generate_batch(requests, model_inputs, generation_kwargs, past_key_values=None):
+    """Run one generate() call, streaming each row's tokens to its request"""
+    global speculative_request
+    
+    streamer = BatchStreamer(requests)
+    if past_key_values is not None:
+        generation_kwargs = dict(generation_kwargs, past_key_values=past_key_values)
+    if requests[0].speculative:
+        generation_kwargs = dict(generation_kwargs, assistant_model=draft_model)
+        # Draft tokens are counted as they are proposed, so they are final by the time the request finishes
+        speculative_request = requests[0]
+    
+    try:
+        with torch.inference_mode():
+            sequences = model_pipeline.model.generate(
+                **model_inputs,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([BatchFinishedCriteria(streamer)]),
+                **generation_kwargs
+            )
+    finally:
+        speculative_request = None
+    streamer.end()
+    return sequences
+
+def run_batch(requests):
+    """Run a group of requests through the model as one padded batch"""
+    started_at = time.time()
+    for generation_request in requests:
+        generation_request.started_at = started_at
+    
+    try:
+        device = model_pipeline.model.device
+        model_inputs = {
+            key: value.to(device) if hasattr(value, "to") else value
+            for key, value in collate_model_inputs(requests).items()
+        }
+        generation_kwargs = get_generation_kwargs(
+            max(generation_request.max_tokens for generation_request in requests),
+            requests[0].temperature
+        )
+        
+        eligible = is_speculation_eligible(requests)
+        requests[0].speculative = use_speculative_decoding(requests)
+        
+        conversation_request = requests[0] if requests[0].conversation_id is not None else None
+        if conversation_request is None:
+            generate_batch(requests, model_inputs, generation_kwargs)
+            if eligible:
+                record_speculation(requests[0], requests[0].speculative)
+            return
+        
+        cache = checkout_conversation_cache(conversation_request)
+        try:
+            sequences = generate_batch(requests, model_inputs, generation_kwargs, cache)
+        except Exception as e:
+            # A reused cache that doesn't fit the prompt must never fail the turn; retry from scratch
+            if conversation_request.cached_tokens == 0 or conversation_request.token_ids:
+                raise
+            logger.warning(f"Discarding KV cache for conversation {conversation_request.conversation_id}: {str(e)}")
+            conversation_request.cached_tokens = 0
+            cache = DynamicCache()
+            sequences = generate_batch(requests, model_inputs, generation_kwargs, cache)
+        store_conversation_cache(conversation_request, cache, sequences)
+        if eligible:
+            record_speculation(conversation_request, conversation_request.speculative)
+    except Exception as e:
+        logger.error(f"Generation error: {str(e)}")
+        for generation_request in requests:
+            generation_request.fail(e)
+
+def group_batch(requests):
+    """Split collected requests into groups that can share one generate() call"""
+    groups = {}
+    for generation_request in requests:
+        if generation_request.batchable:
+            key = ("text", generation_request.temperature)
+        else:
+            key = ("single", id(generation_request))
+        groups.setdefault(key, []).append(generation_request)
+    return list(groups.values())
+
+def scheduler_loop():
+    """Collect requests that arrive within the batching window and run them together"""
+    while True:
+        batch = [generation_queue.get()]
+        deadline = time.time() + BATCH_WINDOW_MS / 1000.0
+        
+        while len(batch) < MAX_BATCH_SIZE:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(generation_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        for group in group_batch(batch):
+            # Requests whose client left or whose deadline passed while queued never reach the model
+            group = [generation_request for generation_request in group if not generation_request.check_interrupted()]
+            if not group:
+                continue
+            with scheduler_stats_lock:
+                scheduler_stats["batches"] += 1
+                scheduler_stats["requests"] += len(group)
+                scheduler_stats["largest_batch"] = max(scheduler_stats["largest_batch"], len(group))
+            BATCH_SIZE.observe(len(group))
+            run_batch(group)
+
+def start_scheduler():
+    """Start the background batching scheduler once"""
+    global scheduler_thread
+    if scheduler_thread is None:
+        scheduler_thread = threading.Thread(target=scheduler_loop, name="generation-scheduler", daemon=True)
+        scheduler_thread.start()
+        logger.info(f"Generation scheduler started (max batch size {MAX_BATCH_SIZE}, window {BATCH_WINDOW_MS}ms, queue depth {MAX_QUEUE_DEPTH})")
+
+def submit_generation(turns, max_tokens, temperature, conversation_id=None, audio=None, deadline=None):
+    """Queue a generation request for the scheduler; raises queue.Full when saturated"""
+    if audio is not None:
+        # Audio placeholder tokens are identical for different clips, so prefix matching can't be trusted
+        conversation_id = None
+    
+    if replica_pool is not None:
+        return replica_pool.submit(turns, max_tokens, temperature, conversation_id, audio, deadline)
+    
+    with TOKENIZATION_SECONDS.time():
+        model_inputs = prepare_model_inputs(turns, audio)
+    generation_request = GenerationRequest(model_inputs, max_tokens, temperature, conversation_id, deadline)
+    
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        generation_queue.put_nowait(generation_request)
+    except queue.Full:
+        REQUESTS_IN_FLIGHT.dec()
+        REJECTED_TOTAL.inc()
+        raise
+    return generation_request
+
+class RemoteGeneration:
+    """Parent-side handle of a request running in a replica, with the interface of GenerationRequest"""
+    
+    def __init__(self, pool, request_id, replica_index, conversation_id):
+        self.pool = pool
+        self.request_id = request_id
+        self.replica_index = replica_index
+        self.conversation_id = conversation_id
+        self.enqueued_at = time.time()
+        self.finish_reason = None
+        self.summary = {}
+        self.events = queue.Queue()
+    
+    @property
+    def speculative(self):
+        return self.summary.get("speculation") is not None
+    
+    def finish(self, summary):
+        self.summary = summary
+        self.finish_reason = summary["finish_reason"]
+        self.events.put(("done", self.finish_reason))
+    
+    def fail(self, message):
+        self.finish_reason = "error"
+        self.events.put(("error", RuntimeError(message)))
+    
+    def cancel(self):
+        self.pool.cancel(self)
+    
+    def usage(self):
+        return self.summary.get("usage")
+    
+    def timing(self):
+        return self.summary.get("timing")
+    
+    def speculation(self):
+        return self.summary.get("speculation")
+
+def relay_generation_events(request_id, generation_request, results, active_requests):
+    """Forward a replica-side request's events to the parent process"""
+    while True:
+        kind, value = generation_request.events.get()
+        if kind == "text":
+            results.put((request_id, "text", value))
+            continue
+        active_requests.pop(request_id, None)
+        if kind == "error":
+            results.put((request_id, "error", str(value)))
+            return
+        else:
+            results.put((request_id, "done", {
+                "finish_reason": generation_request.finish_reason,
+                "usage": generation_request.usage(),
+                "timing": generation_request.timing(),
+                "speculation": generation_request.speculation()
+            }))
+            return
+
+def collect_metric_samples():
+    """Counter and histogram samples of this process by family name, keyed by (sample name, labels)"""
+    families = {}
+    for family in REGISTRY.collect():
+        if family.type not in ("counter", "histogram"):
+            continue
+        samples = families.setdefault(family.name, {})
+        for sample in family.samples:
+            # Creation timestamps don't add up across processes
+            if sample.name.endswith("_created"):
+                continue
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return families
+
+def forward_replica_metrics(index, results, baseline):
+    """Periodically send the parent what this replica counted and observed since the fork"""
+    while True:
+        time.sleep(METRICS_FORWARD_SECONDS)
+        deltas = {}
+        for name, samples in collect_metric_samples().items():
+            inherited = baseline.get(name, {})
+            deltas[name] = {key: value - inherited.get(key, 0.0) for key, value in samples.items()}
+        results.put((None, "metrics", (index, deltas)))
+
+class ReplicaMetrics:
+    """Registry view adding the counters and histograms of the replicas to those of the serving process"""
+    
+    def __init__(self, totals):
+        self.totals = totals
+    
+    def collect(self):
+        for family in REGISTRY.collect():
+            replica_samples = self.totals.get(family.name)
+            if not replica_samples:
+                yield family
+                continue
+            
+            merged = Metric(family.name, family.documentation, family.type, family.unit)
+            seen = set()
+            for sample in family.samples:
+                key = (sample.name, tuple(sorted(sample.labels.items())))
+                seen.add(key)
+                merged.add_sample(sample.name, sample.labels, sample.value + replica_samples.get(key, 0.0), sample.timestamp, sample.exemplar)
+            # Label sets only ever observed in a replica
+            for (name, labels), value in replica_samples.items():
+                if (name, labels) not in seen:
+                    merged.add_sample(name, dict(labels), value)
+            yield merged
+
+def replica_main(index, inbox, results, parent_pid):
+    """Entry point of a forked replica: run a scheduler over the inherited weights and serve the parent"""
+    configure_cpu_runtime(index)
+    # The registry was copied from the parent, whose own samples are already in its /metrics
+    baseline = collect_metric_samples()
+    threading.Thread(target=forward_replica_metrics, args=(index, results, baseline), name="replica-metrics", daemon=True).start()
+    start_scheduler()
+    logger.info(f"Inference replica {index} started (pid {os.getpid()})")
+    active_requests = {}
+    
+    while True:
+        try:
+            message = inbox.get(timeout=1)
+        except queue.Empty:
+            # Exit with the parent instead of lingering as an orphan
+            if os.getppid() != parent_pid:
+                return
+            continue
+        
+        if message[0] == "cancel":
+            generation_request = active_requests.get(message[1])
+            if generation_request is not None:
+                generation_request.cancel()
+            continue
+        _, request_id, turns, max_tokens, temperature, conversation_id, audio, deadline = message
+        try:
+            generation_request = submit_generation(turns, max_tokens, temperature, conversation_id, audio, deadline)
+        except queue.Full:
+            results.put((request_id, "error", "Server is busy, please retry later"))
+            continue
+        except Exception as e:
+            results.put((request_id, "error", str(e)))
+            continue
+        active_requests[request_id] = generation_request
+        threading.Thread(
+            target=relay_generation_events, args=(request_id, generation_request, results, active_requests), daemon=True
+        ).start()
+
+class ReplicaPool:
+    """Inference processes forked after the model is loaded, so read-only weights are shared copy-on-write"""
+    
+    def __init__(self, count):
+        context = multiprocessing.get_context("fork")
+        self.results = context.Queue()
+        self.inboxes = []
+        self.processes = []
+        for index in range(count):
+            inbox = context.Queue()
+            process = context.Process(
+                target=replica_main,
+                args=(index, inbox, self.results, os.getpid()),
+                name=f"llm-replica-{index}",
+                daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        
+        self.in_flight = [0] * count
+        self.pending = {}
+        self.conversation_routes = OrderedDict()
+        self.replica_metrics = {}
+        self.request_ids = itertools.count()
+        self.lock = threading.Lock()
+        # Threads are started only after every fork so no replica inherits a held lock
+        threading.Thread(target=self.collect_results, name="replica-results", daemon=True).start()
+        logger.info(f"Started {count} inference replicas sharing the loaded weights")
+    
+    def pick_replica(self, conversation_id):
+        """Least-loaded live replica, keeping conversations on the replica that holds their KV cache"""
+        alive = [index for index, process in enumerate(self.processes) if process.is_alive()]
+        if not alive:
+            raise RuntimeError("No inference replicas are running")
+        
+        capacity = MAX_QUEUE_DEPTH + MAX_BATCH_SIZE
+        index = self.conversation_routes.get(conversation_id) if conversation_id is not None else None
+        if index not in alive or self.in_flight[index] >= capacity:
+            index = min(alive, key=lambda candidate: self.in_flight[candidate])
+        if self.in_flight[index] >= capacity:
+            raise queue.Full
+        
+        if conversation_id is not None:
+            self.conversation_routes[conversation_id] = index
+            self.conversation_routes.move_to_end(conversation_id)
+            while len(self.conversation_routes) > REPLICA_CONVERSATION_ROUTES:
+                self.conversation_routes.popitem(last=False)
+        return index
+    
+    def submit(self, turns, max_tokens, temperature, conversation_id=None, audio=None, deadline=None):
+        with self.lock:
+            try:
+                index = self.pick_replica(conversation_id)
+            except queue.Full:
+                REJECTED_TOTAL.inc()
+                raise
+            request_id = next(self.request_ids)
+            handle = RemoteGeneration(self, request_id, index, conversation_id)
+            self.pending[request_id] = handle
+            self.in_flight[index] += 1
+            REPLICA_IN_FLIGHT.labels(str(index)).set(self.in_flight[index])
+            # The replicas' own gauges aren't forwarded, so the parent counts the requests it dispatched
+            REQUESTS_IN_FLIGHT.inc()
+        
+        self.inboxes[index].put(("generate", request_id, turns, max_tokens, temperature, conversation_id, audio, deadline))
+        return handle
+    
+    def cancel(self, handle):
+        """Forward a cancellation to the replica running the request"""
+        with self.lock:
+            if handle.request_id not in self.pending:
+                return
+        self.inboxes[handle.replica_index].put(("cancel", handle.request_id))
+    
+    def complete(self, request_id):
+        with self.lock:
+            handle = self.pending.pop(request_id, None)
+            if handle is not None:
+                self.in_flight[handle.replica_index] -= 1
+                REPLICA_IN_FLIGHT.labels(str(handle.replica_index)).set(self.in_flight[handle.replica_index])
+                REQUESTS_IN_FLIGHT.dec()
+        return handle
+    
+    def fail_dead_replicas(self):
+        """Fail the requests of replicas that exited so their clients don't wait forever"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            with self.lock:
+                request_ids = [request_id for request_id, handle in self.pending.items() if handle.replica_index == index]
+            for request_id in request_ids:
+                handle = self.complete(request_id)
+                if handle is not None:
+                    logger.error(f"Inference replica {index} exited with code {process.exitcode}")
+                    handle.fail(f"Inference replica {index} exited")
+    
+    def collect_results(self):
+        while True:
+            try:
+                request_id, kind, value = self.results.get(timeout=1)
+            except queue.Empty:
+                self.fail_dead_replicas()
+                continue
+            
+            if kind == "metrics":
+                index, families = value
+                self.replica_metrics[index] = families
+                continue
+            if kind == "text":
+                with self.lock:
+                    handle = self.pending.get(request_id)
+                if handle is not None:
+                    handle.events.put(("text", value))
+                continue
+            
+            handle = self.complete(request_id)
+            if handle is None:
+                continue
+            if kind == "done":
+                handle.finish(value)
+            else:
+                handle.fail(value)
+    
+    def total_in_flight(self):
+        with self.lock:
+            return sum(self.in_flight)
+    
+    def stats(self):
+        with self.lock:
+            return [
+                {"index": index, "pid": process.pid, "alive": process.is_alive(), "in_flight": self.in_flight[index]}
+                for index, process in enumerate(self.processes)
+            ]
+    
+    def metric_totals(self):
+        """Counter and histogram samples forwarded by the replicas, summed over them"""
+        totals = {}
+        for families in list(self.replica_metrics.values()):
+            for name, samples in families.items():
+                family_totals = totals.setdefault(name, {})
+                for key, value in samples.items():
+                    family_totals[key] = family_totals.get(key, 0.0) + value
+        return totals
+
+def get_queue_depth():
+    """Requests waiting for the scheduler, or all requests dispatched to the replicas when there are any"""
+    if replica_pool is not None:
+        return replica_pool.total_in_flight()
+    return generation_queue.qsize()
+
+QUEUE_DEPTH.set_function(get_queue_depth)
+
+def get_response_cache_key(turns, max_tokens):
+    """Hash of the model, whitespace-normalized messages and token limit of a greedy request"""
+    normalized = [[turn["role"].strip(), " ".join(str(turn["content"]).split())] for turn in turns]
+    key = json.dumps([MODEL_ID, normalized, max_tokens])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def lookup_cached_response(key):
+    """Return a cached response, or None on a miss or an expired entry"""
+    global response_cache_bytes
+    
+    with response_cache_lock:
+        entry = response_cache.get(key)
+        if entry is not None and RESPONSE_CACHE_TTL > 0 and time.time() - entry[0] > RESPONSE_CACHE_TTL:
+            response_cache.pop(key)
+            response_cache_bytes -= entry[1]
+            entry = None
+        
+        if entry is None:
+            response_cache_stats["misses"] += 1
+            RESPONSE_CACHE_LOOKUPS_TOTAL.labels("miss").inc()
+            return None
+        
+        response_cache.move_to_end(key)
+        response_cache_stats["hits"] += 1
+    RESPONSE_CACHE_LOOKUPS_TOTAL.labels("hit").inc()
+    return entry[2]
+
+def store_cached_response(key, text, generation_request):
+    """Cache a completed greedy response, evicting the least recently used entries over the limits"""
+    global response_cache_bytes
+    
+    if generation_request.finish_reason not in ("stop", "length"):
+        return
+    response = {"text": text, "usage": generation_request.usage(), "finish_reason": generation_request.finish_reason}
+    size = len(text.encode())
+    if size > RESPONSE_CACHE_MAX_BYTES:
+        return
+    
+    with response_cache_lock:
+        if key in response_cache:
+            response_cache_bytes -= response_cache.pop(key)[1]
+        response_cache[key] = (time.time(), size, response)
+        response_cache_bytes += size
+        while len(response_cache) > RESPONSE_CACHE_MAX_ENTRIES or response_cache_bytes > RESPONSE_CACHE_MAX_BYTES:
+            _, (_, evicted_size, _) = response_cache.popitem(last=False)
+            response_cache_bytes -= evicted_size
+
+def stream_cached_response(response):
+    """Yield a cached response as the same SSE frames a generation would produce"""
+    yield sse_event({"text": response["text"]})
+    yield sse_event({
+        "text": "",
+        "usage": response["usage"],
+        "finish_reason": response["finish_reason"],
+        "timing": {"queue_ms": 0.0, "inference_ms": 0.0}
+    })
+    yield "data: [DONE]\n\n"
+
+def get_disconnect_check():
+    """Callable telling whether the client of the current request has hung up, or None if the server can't tell"""
+    connection = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    if connection is None:
+        return None
+    
+    def disconnected():
+        # The request body has been read, so a readable socket with no data means the peer closed it
+        try:
+            return connection.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError:
+            return True
+    return disconnected
+
+def next_generation_event(generation_request, disconnected=None):
+    """Wait for the request's next event, cancelling it if the client hangs up in the meantime"""
+    while True:
+        try:
+            return generation_request.events.get(timeout=DISCONNECT_POLL_SECONDS if disconnected else None)
+        except queue.Empty:
+            if disconnected():
+                logger.info("Client disconnected, cancelling generation")
+                generation_request.cancel()
+                # Keep waiting: the scheduler finishes the request at its next decode step
+                disconnected = None
+
+def stream_generate(generation_request, cache_key=None, disconnected=None):
+    """Yield SSE frames as the scheduler decodes tokens for the request"""
+    first_token_time = None
+    parts = []
+    
+    try:
+        while True:
+            kind, value = next_generation_event(generation_request, disconnected)
+            if kind == "text":
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    logger.info(f"Time to first token: {first_token_time - generation_request.enqueued_at:.3f}s")
+                parts.append(value)
+                yield sse_event({"text": value})
+            elif kind == "error":
+                yield sse_event({"error": str(value)})
+                return
+            else:
+                break
+    finally:
+        # The server closes the generator when a write to a departed client fails
+        if generation_request.finish_reason is None:
+            generation_request.cancel()
+    
+    if cache_key is not None:
+        store_cached_response(cache_key, "".join(parts).strip(), generation_request)
+    
+    # Final frame carries usage and finish reason, mirroring the non-streaming response
+    yield sse_event({
+        "text": "",
+        "usage": generation_request.usage(),
+        "finish_reason": generation_request.finish_reason,
+        "timing": generation_request.timing(),
+        **({"speculative": generation_request.speculation()} if generation_request.speculative else {})
+    })
+    yield "data: [DONE]\n\n"
+
+def wait_for_generation(generation_request, disconnected=None):
+    """Block until the request has finished and return the generated text"""
+    parts = []
+    while True:
+        kind, value = next_generation_event(generation_request, disconnected)
+        if kind == "text":
+            parts.append(value)
+        elif kind == "error":
+            raise value
+        else:
+            return "".join(parts)
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     if model_pipeline is None:
         return jsonify({"status": "error", "message": "Model not loaded"}), 503
-    return jsonify({"status": "ok"}), 200
+    return jsonify({"status": "ok", "startup": startup_info}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    # Queueing, prefill and decode happen in the replicas when there are any
+    registry = ReplicaMetrics(replica_pool.metric_totals()) if replica_pool is not None else REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Scheduler configuration and counters"""
+    with scheduler_stats_lock:
+        counters = dict(scheduler_stats)
+    with conversation_cache_lock:
+        kv_cache = {
+            "entries": len(conversation_cache),
+            "bytes": conversation_cache_bytes,
+            "max_bytes": KV_CACHE_MAX_BYTES,
+            "ttl_seconds": KV_CACHE_TTL,
+            **conversation_cache_stats
+        }
+    with response_cache_lock:
+        response_cache_info = {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "entries": len(response_cache),
+            "bytes": response_cache_bytes,
+            "max_entries": RESPONSE_CACHE_MAX_ENTRIES,
+            "max_bytes": RESPONSE_CACHE_MAX_BYTES,
+            "ttl_seconds": RESPONSE_CACHE_TTL,
+            **response_cache_stats
+        }
+    with context_lock:
+        context = {
+            "max_tokens": CONTEXT_MAX_TOKENS,
+            "trim_block_tokens": CONTEXT_TRIM_BLOCK_TOKENS,
+            "summary_enabled": CONTEXT_SUMMARY_ENABLED,
+            "cached_summaries": len(context_summaries),
+            "pending_summaries": len(context_summary_jobs),
+            **context_stats
+        }
+    with token_count_lock:
+        context["cached_token_counts"] = len(token_count_cache)
+    with speculative_stats_lock:
+        speculative = dict(speculative_stats)
+    speculative["enabled"] = draft_model is not None
+    speculative["draft_model"] = DRAFT_MODEL_ID or None
+    speculative["acceptance_rate"] = (
+        speculative["accepted_tokens"] / speculative["draft_tokens"] if speculative["draft_tokens"] else None
+    )
+    speculative["speedup"] = get_speculative_speedup()
+    return jsonify({
+        "startup": startup_info,
+        "replicas": replica_pool.stats() if replica_pool is not None else None,
+        "kv_cache": kv_cache,
+        "response_cache": response_cache_info,
+        "context": context,
+        "speculative": speculative,
+        "scheduler": {
+            "max_batch_size": MAX_BATCH_SIZE,
+            "batch_window_ms": BATCH_WINDOW_MS,
+            "max_queue_depth": MAX_QUEUE_DEPTH,
+            "queue_depth": generation_queue.qsize(),
+            "average_batch_size": counters["requests"] / counters["batches"] if counters["batches"] else 0.0,
+            **counters
+        }
+    })
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    """Text generation endpoint"""
-    data = request.json
+    """Text generation endpoint, accepting speech as a multipart upload or base64 PCM"""
+    audio = None
+    
+    if request.files or request.form:
+        # Multipart: audio file plus form fields, with messages as a JSON string
+        data = request.form.to_dict()
+        try:
+            data['messages'] = json.loads(data.get('messages') or '[]')
+        except ValueError:
+            return jsonify({"error": "Invalid messages format"}), 400
+        audio_file = request.files.get('audio') or request.files.get('audioFile')
+        if audio_file is not None:
+            try:
+                audio = decode_audio_file(audio_file.read())
+            except Exception as e:
+                logger.error(f"Audio decoding error: {str(e)}")
+                return jsonify({"error": "Could not decode audio"}), 400
+    else:
+        data = request.json
+        if data and data.get('audio'):
+            try:
+                audio = decode_pcm16(data['audio'], int(data.get('audio_sample_rate', AUDIO_SAMPLING_RATE)))
+            except Exception as e:
+                logger.error(f"Audio decoding error: {str(e)}")
+                return jsonify({"error": "Could not decode audio"}), 400
     
     if not data:
         return jsonify({"error": "No data provided"}), 400
@@ -143,44 +1737,83 @@ def generate():
     messages = data.get('messages', [])
     max_tokens = int(data.get('max_tokens', 256))
     temperature = float(data.get('temperature', 0.7))
+    stream = parse_flag(data.get('stream', False))
+    conversation_id = data.get('conversation_id')
+    use_cache = parse_flag(data.get('cache', True))
+    deadline_ms = data.get('deadline_ms')
     
-    if not messages:
+    if not messages and audio is None:
         return jsonify({"error": "No messages provided"}), 400
+    deadline = None
+    if deadline_ms is not None:
+        try:
+            deadline_ms = float(deadline_ms)
+        except (TypeError, ValueError):
+            deadline_ms = 0
+        if deadline_ms <= 0:
+            return jsonify({"error": "deadline_ms must be a positive number"}), 400
+        deadline = time.time() + deadline_ms / 1000.0
+    if audio is not None and len(audio) > MAX_AUDIO_SECONDS * AUDIO_SAMPLING_RATE:
+        return jsonify({"error": f"Audio longer than {MAX_AUDIO_SECONDS:g} seconds"}), 400
     
     # Format prompt as expected by Ultravox
     turns = format_chat_prompt(messages)
+    if audio is not None:
+        turns = attach_audio_placeholder(turns)
+    try:
+        turns = fit_context(turns, max_tokens)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Greedy decoding is deterministic, so repeated text-only prompts can be answered from the cache
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED and use_cache and temperature <= 0 and audio is None:
+        cache_key = get_response_cache_key(turns, max_tokens)
+        cached_response = lookup_cached_response(cache_key)
+        if cached_response is not None:
+            headers = {"X-Response-Cache": "hit"}
+            if stream:
+                return Response(
+                    stream_cached_response(cached_response),
+                    mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", **headers}
+                )
+            return jsonify({**cached_response, "timing": {"queue_ms": 0.0, "inference_ms": 0.0}}), 200, headers
     
     try:
-        # Use the pipeline to generate a response
-        response = model_pipeline(
-            {"turns": turns},
-            max_new_tokens=max_tokens,
-            temperature=temperature,
-            do_sample=temperature > 0
+        generation_request = submit_generation(
+            turns, max_tokens, temperature, str(conversation_id) if conversation_id else None, audio, deadline
         )
+    except queue.Full:
+        logger.warning("Generation queue is full, rejecting request")
+        return (
+            jsonify({"error": "Server is busy, please retry later"}),
+            503,
+            {"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+    
+    disconnected = get_disconnect_check()
+    if stream:
+        return Response(
+            stream_with_context(stream_generate(generation_request, cache_key, disconnected)),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        generated_text = wait_for_generation(generation_request, disconnected)
+        if cache_key is not None:
+            store_cached_response(cache_key, generated_text.strip(), generation_request)
         
-        # Extract the generated text
-        if isinstance(response, dict) and "generated_text" in response:
-            generated_text = response["generated_text"]
-        elif isinstance(response, str):
-            generated_text = response
-        else:
-            # Try to get the best guess of the response
-            generated_text = str(response)
-        
-        # Calculate token counts (approximate)
-        prompt_tokens = sum(count_tokens(msg['content']) for msg in messages)
-        completion_tokens = count_tokens(generated_text)
-        
-        return jsonify({
+        result = {
             "text": generated_text.strip(),
-            "usage": {
-                "prompt_tokens": prompt_tokens,
-                "completion_tokens": completion_tokens,
-                "total_tokens": prompt_tokens + completion_tokens
-            },
-            "finish_reason": "stop"
-        })
+            "usage": generation_request.usage(),
+            "finish_reason": generation_request.finish_reason,
+            "timing": generation_request.timing()
+        }
+        if generation_request.speculative:
+            result["speculative"] = generation_request.speculation()
+        return jsonify(result)
     except Exception as e:
         logger.error(f"Generation error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -205,10 +1838,76 @@ def handle_exception(e):
     logger.error(f"Error: {str(e)}")
     return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
-    # Load the model when the app starts
+def load_service():
+    """Load the models and apply the CPU engine"""
+    # Replicas pin themselves after the fork; the parent loads with every core
+    configure_cpu_runtime(0 if REPLICAS <= 1 else None)
     load_model()
+    load_draft_model()
+    apply_cpu_engine()
+
+def start_serving():
+    """Start the scheduler, or fork the inference replicas"""
+    global replica_pool
+    
+    if REPLICAS > 1:
+        if DEVICE == 'cpu':
+            replica_pool = ReplicaPool(REPLICAS)
+            return
+        logger.warning("CUDA state can't be shared with forked processes, serving with a single replica")
+    start_scheduler()
+
+def start_service():
+    """Load the model and start the scheduler, or fork the inference replicas, in the serving process"""
+    load_service()
+    start_serving()
+
+def boot_worker(worker):
+    """Load in a gunicorn worker, heartbeating so the arbiter doesn't kill a load that outlasts the timeout"""
+    stop = threading.Event()
     
-    # Start the Flask app
-    app.run(host='0.0.0.0', port=SERVE_PORT, debug=False)
+    def send_heartbeats():
+        while not stop.wait(BOOT_HEARTBEAT_SECONDS):
+            worker.notify()
+    
+    heartbeat = threading.Thread(target=send_heartbeats, name="boot-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        load_service()
+    finally:
+        stop.set()
+        heartbeat.join()
+    # Replicas are forked only once the heartbeat thread is gone, so this is still the only thread
+    start_serving()
+
+def run_production_server():
+    """Serve with gunicorn: one worker process owns the model, a bounded pool of threads handles requests"""
+    from gunicorn.app.base import BaseApplication
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{SERVE_PORT}")
+            # A single worker keeps one copy of the weights; requests share it through the scheduler
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", SERVE_THREADS)
+            self.cfg.set("worker_connections", SERVE_THREADS + MAX_QUEUE_DEPTH)
+            self.cfg.set("timeout", 120)
+            # Load after fork so CUDA is initialized in the worker, not the master
+            self.cfg.set("post_worker_init", boot_worker)
+        
+        def load(self):
+            return app
+    
+    ProductionServer().run()
+
+if __name__ == '__main__':
+    if SERVE_MODE == 'production':
+        run_production_server()
+    else:
+        # Load the model when the app starts
+        start_service()
+        
+        # Start the Flask development server
+        app.run(host='0.0.0.0', port=SERVE_PORT, debug=False)
     logger.info(f"LLM service started on http://0.0.0.0:{SERVE_PORT}")
\ No newline at end of file
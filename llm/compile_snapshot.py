@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Compile a pre-quantized snapshot of the LLM for fast restarts
+Loads MODEL_ID once with the configured quantization and saves the quantized
+weights as safetensors to LLM_SNAPSHOT_PATH, which app.py then loads directly
+"""
+
+import sys
+import time
+
+from app import (
+    logger,
+    load_model,
+    save_snapshot,
+    MODEL_ID,
+    QUANTIZATION_MODE,
+    SNAPSHOT_PATH
+)
+
+def main():
+    """Main function"""
+    logger.info("=" * 60)
+    logger.info("LLM Snapshot Compiler")
+    logger.info("=" * 60)
+    logger.info(f"Model: {MODEL_ID}")
+    logger.info(f"Quantization: {QUANTIZATION_MODE}")
+    logger.info(f"Snapshot: {SNAPSHOT_PATH}")
+    logger.info("=" * 60)
+    
+    start_time = time.time()
+    try:
+        load_model(use_snapshot=False)
+        save_snapshot()
+    except Exception as e:
+        logger.error(f"Error compiling snapshot: {e}")
+        sys.exit(1)
+    
+    logger.info(f"Snapshot compiled in {time.time() - start_time:.1f}s")
+    logger.info("Restart the LLM service to load it")
+
+if __name__ == "__main__":
+    main()
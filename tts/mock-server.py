@@ -7,6 +7,7 @@ This is a temporary workaround until the full TTS service can be made to work.
 import os
 import io
 import json
+import wave
 import logging
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
@@ -29,6 +30,9 @@ CORS(app)
 # Configuration
 SERVE_PORT = int(os.getenv('TTS_PORT', 6000))
 CUSTOM_VOICES_PATH = os.getenv('CUSTOM_VOICES_PATH', './voices')
+SAMPLING_RATE = 24000
+# Roughly 150 words per minute, so mock audio is as long as real speech would be
+WORDS_PER_SECOND = 2.5
 
 # Ensure directories exist
 os.makedirs(CUSTOM_VOICES_PATH, exist_ok=True)
@@ -68,10 +72,18 @@ def text_to_speech():
         # Generate a silent audio file
         logger.info(f"Mock TTS request for text: {text[:30]}... (voice: {voice})")
         
-        # Create a small silent WAV file in memory
+        # Silence as long as the text would take to speak, so clients see real audio durations
+        seconds = max(0.5, len(text.split()) / WORDS_PER_SECOND)
+        silence = b'\x00\x00' * int(seconds * SAMPLING_RATE)
         buffer = io.BytesIO()
-        with open("silence.wav", "rb") as f:
-            buffer.write(f.read())
+        if format.lower() == 'pcm':
+            buffer.write(silence)
+        else:
+            with wave.open(buffer, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(SAMPLING_RATE)
+                wav_file.writeframes(silence)
         buffer.seek(0)
         
         # Return audio file
@@ -113,10 +125,5 @@ def handle_exception(e):
     return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    # Create a simple silent WAV file
-    with open("silence.wav", "wb") as f:
-        # WAV header for a 1-second silent audio
-        f.write(b'RIFF$\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00\x80>\x00\x00\x00}\x00\x00\x02\x00\x10\x00data\x00\x00\x00\x00')
-    
     logger.info(f"Starting mock TTS server on port {SERVE_PORT}")
     app.run(host='0.0.0.0', port=SERVE_PORT, debug=False)
\ No newline at end of file
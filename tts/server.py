@@ -1,19 +1,36 @@
 import os
 import io
+import re
 import uuid
+import struct
+import tempfile
 import time
+import bisect
+import hashlib
+import inspect
+from math import gcd
 import json
 import logging
-import tempfile
 import shutil
+import zipfile
+import queue
+import socket
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 import numpy as np
 import torch
 import torchaudio
-import librosa
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, request, jsonify, send_file, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.metrics_core import Metric
 import soundfile as sf
+from scipy.signal import resample_poly
 from dotenv import load_dotenv
 from pydub import AudioSegment
 
@@ -27,8 +44,16 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+class InMemoryUploadRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling them to temp files"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('TTS_MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
 CORS(app)
 
 # Configuration
@@ -38,20 +63,209 @@ SPEAKER_EMBEDDINGS_PATH = os.getenv('SPEAKER_EMBEDDINGS_PATH', './models/speaker
 CUSTOM_VOICES_PATH = os.getenv('CUSTOM_VOICES_PATH', './voices')
 SERVE_PORT = int(os.getenv('TTS_PORT', 6000))
 DEFAULT_SAMPLING_RATE = 24000
+OPUS_SAMPLING_RATE = 48000
+ENCODER_WORKERS = int(os.getenv('TTS_ENCODER_WORKERS', 2))
+EMBEDDING_WORKERS = int(os.getenv('TTS_EMBEDDING_WORKERS', 1))
+STREAM_CHUNK_MAX_CHARS = int(os.getenv('TTS_STREAM_CHUNK_MAX_CHARS', 200))
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "e.g", "i.e",
+    "inc", "ltd", "co", "corp", "approx", "dept", "est", "jan", "feb",
+    "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "a.m", "p.m"
+}
+# Abbreviations that are also ordinary words, so only "No. 5" or "Fig. 2" keeps them in the sentence
+NUMBER_ABBREVIATIONS = {"no", "fig", "mar", "vol"}
+EMBEDDING_CACHE_SIZE = int(os.getenv('TTS_EMBEDDING_CACHE_SIZE', 128))
+EMBEDDING_FILENAME = "embedding.pt"
+SYNTHESIS_WORKERS = int(os.getenv('TTS_SYNTHESIS_WORKERS', 4))
+TTS_MAX_QUEUE_DEPTH = int(os.getenv('TTS_MAX_QUEUE_DEPTH', 64))
+RETRY_AFTER_SECONDS = int(os.getenv('TTS_RETRY_AFTER', 1))
+DISCONNECT_POLL_SECONDS = 0.25
+SERVE_MODE = os.getenv('SERVE_MODE', 'development').lower()
+WARMUP_ENABLED = os.getenv('TTS_WARMUP_ENABLED', 'True').lower() == 'true'
+WARMUP_TEXT = os.getenv('TTS_WARMUP_TEXT', 'Hello! This is a short warmup sentence.')
+SERVE_THREADS = int(os.getenv('TTS_SERVE_THREADS', 16))
+AUDIO_CACHE_ENABLED = os.getenv('TTS_AUDIO_CACHE_ENABLED', 'True').lower() == 'true'
+AUDIO_CACHE_PATH = os.getenv('TTS_AUDIO_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(BASE_MODEL_PATH)), 'audio_cache'))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('TTS_AUDIO_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+AUDIO_CACHE_DISK_MAX_BYTES = int(os.getenv('TTS_AUDIO_CACHE_DISK_MAX_BYTES', 4 * 1024 * 1024 * 1024))
+VOICE_INDEX_REFRESH_INTERVAL = float(os.getenv('TTS_VOICE_INDEX_REFRESH_INTERVAL', 5))
+CPU_ENGINE = os.getenv('CPU_ENGINE', 'eager').lower()
+CPU_THREADS = int(os.getenv('TTS_CPU_THREADS', 0))
+CPU_INTEROP_THREADS = int(os.getenv('TTS_CPU_INTEROP_THREADS', 1))
+CPU_CORES = os.getenv('TTS_CPU_CORES', '')
+CPU_COMPILE = os.getenv('TTS_CPU_COMPILE', 'False').lower() == 'true'
+CPU_ENGINE_BENCHMARK = os.getenv('CPU_ENGINE_BENCHMARK', 'True').lower() == 'true'
+TTS_REPLICAS = int(os.getenv('TTS_REPLICAS', 1))
+BOOT_HEARTBEAT_SECONDS = 5
+METRICS_FORWARD_SECONDS = 5
+LONGFORM_MIN_CHARS = int(os.getenv('TTS_LONGFORM_MIN_CHARS', 2000))
+LONGFORM_SEGMENT_CHARS = int(os.getenv('TTS_LONGFORM_SEGMENT_CHARS', 400))
+LONGFORM_PARALLELISM = int(os.getenv('TTS_LONGFORM_PARALLELISM', SYNTHESIS_WORKERS * max(1, TTS_REPLICAS)))
+LONGFORM_CROSSFADE_MS = float(os.getenv('TTS_LONGFORM_CROSSFADE_MS', 20))
+LONGFORM_TARGET_DBFS = float(os.getenv('TTS_LONGFORM_TARGET_DBFS', -20))
+LONGFORM_SPOOL_BYTES = int(os.getenv('TTS_LONGFORM_SPOOL_BYTES', 16 * 1024 * 1024))
+JOBS_PATH = os.getenv('TTS_JOBS_PATH', os.path.join(os.path.dirname(os.path.abspath(BASE_MODEL_PATH)), 'jobs'))
+JOB_MAX_ITEMS = int(os.getenv('TTS_JOB_MAX_ITEMS', 10000))
+JOB_PARALLELISM = int(os.getenv('TTS_JOB_PARALLELISM', SYNTHESIS_WORKERS * max(1, TTS_REPLICAS)))
+JOB_STATUS_INTERVAL = 1.0
+JOB_MAX_ERRORS = 20
+
+# libsndfile container and subtype for each format encoded in-process
+SOUNDFILE_FORMATS = {
+    'wav': ('WAV', 'PCM_16'),
+    'flac': ('FLAC', 'PCM_16'),
+    'ogg': ('OGG', 'VORBIS'),
+    'opus': ('OGG', 'OPUS'),
+    'mp3': ('MP3', 'MPEG_LAYER_III'),
+}
+AUDIO_MIMETYPES = {
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+}
+STREAMING_FORMATS = ['wav', 'pcm', 'opus']
+
+# Built-in voices
+PRESET_VOICES = [
+    {"id": "default", "name": "Default", "type": "base"},
+    {"id": "warm", "name": "Warm", "type": "base"},
+    {"id": "bright", "name": "Bright", "type": "base"},
+    {"id": "calm", "name": "Calm", "type": "base"},
+]
+PRESET_VOICE_IDS = [voice["id"] for voice in PRESET_VOICES]
 
 # Ensure directories exist
 os.makedirs(CUSTOM_VOICES_PATH, exist_ok=True)
 os.makedirs(BASE_MODEL_PATH, exist_ok=True)
 os.makedirs(SPEAKER_EMBEDDINGS_PATH, exist_ok=True)
+if AUDIO_CACHE_ENABLED:
+    os.makedirs(AUDIO_CACHE_PATH, exist_ok=True)
+os.makedirs(JOBS_PATH, exist_ok=True)
 
 # Global variables for models
 base_model = None
 speaker_encoder = None
 vocoder = None
+converter = None
+# Whether the converter can synthesize from a precomputed speaker embedding
+converter_uses_embeddings = False
+
+# Startup phase progress reported by /ready
+startup_state = {
+    "status": "not_started",
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "cpu": None,
+    "replicas": 1,
+    "error": None
+}
+
+# Speaker embeddings of cloned voices, most recently used last
+speaker_embedding_cache = OrderedDict()
+speaker_embedding_lock = threading.Lock()
+
+# Batching scheduler state
+synthesis_queue = queue.Queue(maxsize=TTS_MAX_QUEUE_DEPTH)
+synthesis_scheduler_thread = None
+synthesis_scheduler_lock = threading.Lock()
+# Batches run on worker threads so model calls overlap; the slots keep unstarted work in the bounded queue
+synthesis_pool = None
+synthesis_slots = None
+
+# Encoding runs on its own pool so CPU-bound encoders don't pile up on request threads
+encoder_pool = ThreadPoolExecutor(max_workers=ENCODER_WORKERS, thread_name_prefix="audio-encoder")
+
+# Speaker embeddings of new voices are extracted in the background
+embedding_pool = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embedding-job")
+embedding_jobs = {}
+embedding_jobs_lock = threading.Lock()
+
+# Synthesized audio cache, most recently used last: key -> (voice_id, audio bytes)
+audio_cache = OrderedDict()
+audio_cache_bytes = 0
+audio_cache_lock = threading.Lock()
+audio_cache_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+# Size of the disk tier, None until the cache directory is scanned
+audio_cache_disk_bytes = None
+audio_cache_disk_lock = threading.Lock()
+
+# Prometheus metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUEUE_WAIT_SECONDS = Histogram('tts_queue_wait_seconds', 'Time requests wait for the synthesis scheduler', buckets=LATENCY_BUCKETS)
+SYNTHESIS_SECONDS = Histogram('tts_synthesis_seconds', 'Model and vocoder time per synthesis request', buckets=LATENCY_BUCKETS)
+MODEL_SECONDS = Histogram('tts_model_seconds', 'Acoustic model time per forward pass', buckets=LATENCY_BUCKETS)
+VOCODER_SECONDS = Histogram('tts_vocoder_seconds', 'Vocoder time per forward pass', buckets=LATENCY_BUCKETS)
+ENCODE_SECONDS = Histogram('tts_encode_seconds', 'Audio encoding time', ['format'], buckets=LATENCY_BUCKETS)
+EMBEDDING_SECONDS = Histogram('tts_embedding_seconds', 'Speaker embedding extraction time', buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram('tts_request_duration_seconds', 'End-to-end /tts time', ['mode'], buckets=LATENCY_BUCKETS)
+TIME_TO_FIRST_AUDIO_SECONDS = Histogram('tts_time_to_first_audio_seconds', 'Time until the first streamed audio chunk', buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('tts_requests_in_flight', 'Synthesis requests queued or running')
+QUEUE_DEPTH = Gauge('tts_queue_depth', 'Requests waiting for the synthesis scheduler, or dispatched to the replicas')
+MODEL_MEMORY_BYTES = Gauge('tts_model_memory_bytes', 'Memory held by the loaded model parameters')
+AUDIO_CACHE_LOOKUPS_TOTAL = Counter('tts_audio_cache_lookups_total', 'Audio cache lookups', ['result'])
+ERRORS_TOTAL = Counter('tts_errors_total', 'Failed synthesis requests')
+REJECTED_TOTAL = Counter('tts_rejected_requests_total', 'Requests rejected because the queue was full')
+INTERRUPTED_TOTAL = Counter('tts_interrupted_requests_total', 'Synthesis stopped because the client left or the deadline passed', ['reason', 'stage'])
+REPLICA_IN_FLIGHT = Gauge('tts_replica_requests_in_flight', 'Synthesis requests dispatched to each replica', ['replica'])
+
+# Bulk synthesis jobs by id; each job's status is mirrored to status.json in its directory
+jobs = {}
+jobs_lock = threading.Lock()
+job_queue = queue.Queue()
+
+# Synthesis replicas forked after loading, set only in the parent process
+synthesis_replica_pool = None
+# Set in replicas, whose new voices get their embedding from the parent's background job
+is_synthesis_replica = False
+# How long a replica waits for the parent to finish a just-cloned voice before extracting it itself
+VOICE_READY_WAIT_SECONDS = 60
+
+# In-memory index of cloned voices, kept sorted by id for cursor pagination
+voice_index = {}
+voice_index_ids = []
+voice_index_lock = threading.Lock()
+voice_index_changed = threading.Condition(voice_index_lock)
+voice_index_generation = uuid.uuid4().hex
+voice_index_version = 0
+voice_index_mtime = None
+voice_index_checked_at = 0.0
+
+def supports_speaker_embeddings(tts_converter):
+    """Whether a converter extracts speaker embeddings and accepts them in tts(), not only reference audio"""
+    if not hasattr(tts_converter, "extract_se"):
+        return False
+    try:
+        return "speaker_embedding" in inspect.signature(tts_converter.tts).parameters
+    except (TypeError, ValueError):
+        return False
+
+def observe_forward_time(model, histogram):
+    """Record the duration of each forward pass of a model in a histogram"""
+    if not isinstance(model, torch.nn.Module):
+        return
+    # Synthesis workers share the models, so each thread keeps its own start time
+    started = threading.local()
+    
+    def before_forward(module, inputs):
+        started.at = time.time()
+    
+    def after_forward(module, inputs, output):
+        started_at = getattr(started, "at", None)
+        if started_at is not None:
+            histogram.observe(time.time() - started_at)
+            started.at = None
+    
+    # Keep the timing out of compiled graphs
+    disable = torch.compiler.disable if hasattr(torch, "compiler") else (lambda hook: hook)
+    model.register_forward_pre_hook(disable(before_forward))
+    model.register_forward_hook(disable(after_forward))
 
 def load_models():
     """Load TTS models and components"""
-    global base_model, speaker_encoder, vocoder
+    global base_model, speaker_encoder, vocoder, converter, converter_uses_embeddings
     
     try:
         # Import OpenVoice modules here to avoid importing at the top level
@@ -82,132 +296,1538 @@ def load_models():
             device=DEVICE
         )
         
+        observe_forward_time(base_model, MODEL_SECONDS)
+        observe_forward_time(vocoder, VOCODER_SECONDS)
+        
+        # One long-lived converter is shared by all requests
+        converter = ToneColorConverter(base_model, speaker_encoder, vocoder)
+        converter_uses_embeddings = supports_speaker_embeddings(converter)
+        if not converter_uses_embeddings:
+            logger.info("Converter has no speaker embedding support, cloned voices synthesize from their reference audio")
+        
         logger.info("Models loaded successfully")
     except Exception as e:
         logger.error(f"Error loading models: {e}")
-        base_model, speaker_encoder, vocoder = None, None, None
+        base_model, speaker_encoder, vocoder, converter = None, None, None, None
+
+def get_model_memory_bytes():
+    """Bytes held by the parameters and buffers of the loaded models"""
+    total = 0
+    for model in (base_model, speaker_encoder, vocoder):
+        if isinstance(model, torch.nn.Module):
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+MODEL_MEMORY_BYTES.set_function(get_model_memory_bytes)
+
+def read_voice_entry(voice_id):
+    """Read the catalog entry of a cloned voice from its metadata file"""
+    voice_path = os.path.join(CUSTOM_VOICES_PATH, voice_id)
+    if voice_id in PRESET_VOICE_IDS or not os.path.isdir(voice_path):
+        return None
+    
+    # Check for metadata file
+    metadata_path = os.path.join(voice_path, "metadata.json")
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            return {
+                "id": voice_id,
+                "name": metadata.get("name", voice_id),
+                "description": metadata.get("description", ""),
+                "created_at": metadata.get("created_at", ""),
+                "status": metadata.get("status", "ready"),
+                "type": "custom"
+            }
+        except Exception as e:
+            logger.error(f"Error reading metadata for voice {voice_id}: {e}")
+    
+    return {
+        "id": voice_id,
+        "name": voice_id,
+        "type": "custom"
+    }
+
+def add_voice_to_index(voice_id):
+    """Add or refresh a cloned voice in the index"""
+    global voice_index_version
+    
+    entry = read_voice_entry(voice_id)
+    if entry is None:
+        return
+    
+    with voice_index_lock:
+        if voice_id not in voice_index:
+            bisect.insort(voice_index_ids, voice_id)
+        voice_index[voice_id] = entry
+        voice_index_version += 1
+        voice_index_changed.notify_all()
+    
+    # Replicas have their own copy of the index
+    if synthesis_replica_pool is not None:
+        synthesis_replica_pool.update_voice(voice_id)
+
+def remove_voice_from_index(voice_id):
+    """Remove a cloned voice from the index"""
+    global voice_index_version
+    
+    with voice_index_lock:
+        if voice_index.pop(voice_id, None) is None:
+            return
+        position = bisect.bisect_left(voice_index_ids, voice_id)
+        if position < len(voice_index_ids) and voice_index_ids[position] == voice_id:
+            del voice_index_ids[position]
+        voice_index_version += 1
+        voice_index_changed.notify_all()
+    
+    if synthesis_replica_pool is not None:
+        synthesis_replica_pool.update_voice(voice_id)
+
+def refresh_voice_index(force=False):
+    """Pick up voices added or removed outside the API, using the directory mtime"""
+    global voice_index_mtime, voice_index_checked_at
+    
+    now = time.time()
+    if not force and now - voice_index_checked_at < VOICE_INDEX_REFRESH_INTERVAL:
+        return
+    voice_index_checked_at = now
+    
+    try:
+        mtime = os.stat(CUSTOM_VOICES_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if not force and mtime == voice_index_mtime:
+        return
+    voice_index_mtime = mtime
+    
+    on_disk = set(os.listdir(CUSTOM_VOICES_PATH))
+    with voice_index_lock:
+        indexed = set(voice_index)
+    
+    # Only voices that appeared or disappeared are touched, existing entries are kept
+    for voice_id in sorted(on_disk - indexed):
+        add_voice_to_index(voice_id)
+    for voice_id in indexed - on_disk:
+        remove_voice_from_index(voice_id)
+
+def voice_exists(voice_id):
+    """Whether a voice is a preset or an indexed cloned voice"""
+    if voice_id in PRESET_VOICE_IDS:
+        return True
+    refresh_voice_index()
+    if voice_id not in voice_index:
+        # The voice may have been cloned since the last rate-limited refresh
+        refresh_voice_index(force=True)
+    return voice_id in voice_index
+
+def build_voice_index():
+    """Build the voice index from the voices directory"""
+    start_time = time.time()
+    refresh_voice_index(force=True)
+    logger.info(f"Indexed {len(voice_index)} custom voices in {time.time() - start_time:.3f}s")
+
+def get_voice_index_etag(cursor=None, limit=None):
+    """ETag for a page of the voice catalog, changes whenever the index does"""
+    key = f"{voice_index_generation}:{voice_index_version}:{cursor}:{limit}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def get_voice_page(cursor=None, limit=None):
+    """Get a page of voices after the given cursor, presets first then custom voices by id"""
+    with voice_index_lock:
+        if cursor is None:
+            preset_start, custom_start = 0, 0
+        elif cursor in PRESET_VOICE_IDS:
+            preset_start, custom_start = PRESET_VOICE_IDS.index(cursor) + 1, 0
+        else:
+            preset_start = len(PRESET_VOICES)
+            custom_start = bisect.bisect_right(voice_index_ids, cursor)
+        
+        remaining = (len(PRESET_VOICES) - preset_start) + (len(voice_index_ids) - custom_start)
+        if limit is None:
+            limit = remaining
+        
+        voices = list(PRESET_VOICES[preset_start:preset_start + limit])
+        custom_ids = voice_index_ids[custom_start:custom_start + limit - len(voices)]
+        voices.extend(voice_index[voice_id] for voice_id in custom_ids)
+    
+    next_cursor = voices[-1]["id"] if voices and remaining > len(voices) else None
+    return voices, next_cursor
 
 def get_available_voices():
     """Get list of available voice models"""
-    voices = []
-    
-    # Add default voices
-    default_voices = [
-        {"id": "default", "name": "Default", "type": "base"},
-        {"id": "warm", "name": "Warm", "type": "base"},
-        {"id": "bright", "name": "Bright", "type": "base"},
-        {"id": "calm", "name": "Calm", "type": "base"},
-    ]
-    voices.extend(default_voices)
-    
-    # Add custom voices
-    if os.path.exists(CUSTOM_VOICES_PATH):
-        for voice_dir in os.listdir(CUSTOM_VOICES_PATH):
-            voice_path = os.path.join(CUSTOM_VOICES_PATH, voice_dir)
-            if os.path.isdir(voice_path):
-                # Check for metadata file
-                metadata_path = os.path.join(voice_path, "metadata.json")
-                if os.path.exists(metadata_path):
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            metadata = json.load(f)
-                            voices.append({
-                                "id": voice_dir,
-                                "name": metadata.get("name", voice_dir),
-                                "description": metadata.get("description", ""),
-                                "created_at": metadata.get("created_at", ""),
-                                "type": "custom"
-                            })
-                    except Exception as e:
-                        logger.error(f"Error reading metadata for voice {voice_dir}: {e}")
-                        voices.append({
-                            "id": voice_dir,
-                            "name": voice_dir,
-                            "type": "custom"
-                        })
-                else:
-                    voices.append({
-                        "id": voice_dir,
-                        "name": voice_dir,
-                        "type": "custom"
-                    })
-    
+    refresh_voice_index()
+    voices, _ = get_voice_page()
     return voices
 
 def ensure_models_loaded():
     """Ensure models are loaded before processing requests"""
-    global base_model, speaker_encoder, vocoder
+    global base_model, speaker_encoder, vocoder, converter
     
-    if base_model is None or speaker_encoder is None or vocoder is None:
+    # Loading is owned by the startup phase; only load inline when no startup phase ran at all
+    if startup_state["status"] == "not_started" and (
+        base_model is None or speaker_encoder is None or vocoder is None or converter is None
+    ):
         load_models()
         
-    if base_model is None or speaker_encoder is None or vocoder is None:
+    if base_model is None or speaker_encoder is None or vocoder is None or converter is None:
         raise RuntimeError("Models not loaded. Please check logs for details.")
 
-def synthesize_speech(text, voice_id="default", speed=1.0):
-    """Synthesize speech from text using the specified voice"""
-    ensure_models_loaded()
+def get_reference_audio_path(voice_id):
+    """Path of the reference recording of a cloned voice"""
+    voice_dir = os.path.join(CUSTOM_VOICES_PATH, voice_id)
+    if not os.path.exists(voice_dir):
+        logger.error(f"Custom voice directory not found: {voice_dir}")
+        raise ValueError(f"Voice not found: {voice_id}")
     
+    # Find reference audio file
+    reference_audio_path = os.path.join(voice_dir, "reference.wav")
+    if not os.path.exists(reference_audio_path):
+        reference_files = list(Path(voice_dir).glob("*.wav"))
+        if not reference_files:
+            logger.error(f"No reference audio found in {voice_dir}")
+            raise ValueError(f"No reference audio found for voice: {voice_id}")
+        reference_audio_path = str(reference_files[0])
+    return reference_audio_path
+
+def compute_speaker_embedding(voice_id):
+    """Extract the speaker embedding of a cloned voice and persist it next to its metadata"""
+    reference_audio_path = get_reference_audio_path(voice_id)
+    voice_dir = os.path.dirname(reference_audio_path)
+    
+    with EMBEDDING_SECONDS.time():
+        embedding = converter.extract_se([reference_audio_path])
+    
+    # Write atomically so a concurrent reader never sees a partial file
+    embedding_path = os.path.join(voice_dir, EMBEDDING_FILENAME)
+    temp_path = f"{embedding_path}.{uuid.uuid4().hex}.tmp"
+    torch.save(embedding, temp_path)
+    os.replace(temp_path, embedding_path)
+    
+    logger.info(f"Computed speaker embedding for voice {voice_id}")
+    return embedding
+
+def cache_speaker_embedding(voice_id, embedding):
+    """Store an embedding in the in-memory LRU, evicting the least recently used entries"""
+    with speaker_embedding_lock:
+        speaker_embedding_cache[voice_id] = embedding
+        speaker_embedding_cache.move_to_end(voice_id)
+        while len(speaker_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            speaker_embedding_cache.popitem(last=False)
+
+def get_speaker_embedding(voice_id):
+    """Get the speaker embedding of a cloned voice from memory, disk, or by computing it"""
+    with speaker_embedding_lock:
+        if voice_id in speaker_embedding_cache:
+            speaker_embedding_cache.move_to_end(voice_id)
+            return speaker_embedding_cache[voice_id]
+    
+    # A voice that was just cloned waits for its background job rather than extracting twice
+    with embedding_jobs_lock:
+        job = embedding_jobs.get(voice_id)
+    if job is not None:
+        job.result()
+        with speaker_embedding_lock:
+            if voice_id in speaker_embedding_cache:
+                return speaker_embedding_cache[voice_id]
+    
+    if not voice_exists(voice_id):
+        logger.error(f"Custom voice not found: {voice_id}")
+        raise ValueError(f"Voice not found: {voice_id}")
+    
+    embedding_path = os.path.join(CUSTOM_VOICES_PATH, voice_id, EMBEDDING_FILENAME)
+    if is_synthesis_replica and not os.path.exists(embedding_path):
+        wait_for_voice_ready(voice_id)
+    if os.path.exists(embedding_path):
+        embedding = torch.load(embedding_path, map_location=DEVICE)
+    else:
+        embedding = compute_speaker_embedding(voice_id)
+    
+    cache_speaker_embedding(voice_id, embedding)
+    return embedding
+
+def wait_for_voice_ready(voice_id):
+    """Wait until the parent's embedding job has finished a pending voice, bounded by VOICE_READY_WAIT_SECONDS"""
+    deadline = time.time() + VOICE_READY_WAIT_SECONDS
+    with voice_index_changed:
+        # The parent broadcasts the voice's new status once its job is done
+        while voice_index.get(voice_id, {}).get("status") == "pending":
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.warning(f"Embedding job of voice {voice_id} still pending, extracting it in the replica")
+                return
+            voice_index_changed.wait(remaining)
+
+def update_voice_metadata(voice_id, **fields):
+    """Merge fields into a voice's metadata file and refresh its index entry"""
+    metadata_path = os.path.join(CUSTOM_VOICES_PATH, voice_id, "metadata.json")
+    if not os.path.exists(metadata_path):
+        # The voice was deleted while a job was running
+        return
+    
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    metadata.update(fields)
+    
+    temp_path = f"{metadata_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(temp_path, metadata_path)
+    add_voice_to_index(voice_id)
+
+def run_embedding_job(voice_id):
+    """Extract and persist the speaker embedding of a newly cloned voice"""
+    # Wait for the startup phase instead of failing jobs submitted while models load
+    while startup_state["status"] in ("loading", "warming_up"):
+        time.sleep(1)
+    
+    try:
+        ensure_models_loaded()
+        if converter_uses_embeddings:
+            cache_speaker_embedding(voice_id, compute_speaker_embedding(voice_id))
+        else:
+            # Without embedding support the reference recording is all synthesis needs
+            get_reference_audio_path(voice_id)
+        update_voice_metadata(voice_id, status="ready")
+    except Exception as e:
+        logger.error(f"Error extracting embedding for voice {voice_id}: {e}")
+        update_voice_metadata(voice_id, status="failed", error=str(e))
+    finally:
+        with embedding_jobs_lock:
+            embedding_jobs.pop(voice_id, None)
+
+def submit_embedding_job(voice_id):
+    """Queue background embedding extraction for a voice"""
+    with embedding_jobs_lock:
+        embedding_jobs[voice_id] = embedding_pool.submit(run_embedding_job, voice_id)
+
+def decode_uploaded_audio(stream, target_sr=DEFAULT_SAMPLING_RATE):
+    """Decode an uploaded audio stream to mono float32 at the target sampling rate"""
     try:
-        # Import OpenVoice modules
-        from openvoice.api import ToneColorConverter
+        audio, sample_rate = sf.read(stream, dtype='float32', always_2d=True)
+        audio = audio.mean(axis=1)
+    except Exception:
+        # Containers libsndfile can't parse (e.g. browser webm/m4a recordings) are piped through ffmpeg
+        stream.seek(0)
+        segment = AudioSegment.from_file(stream).set_channels(1)
+        sample_rate = segment.frame_rate
+        audio = np.array(segment.get_array_of_samples(), dtype=np.float32) / float(1 << (8 * segment.sample_width - 1))
+    return resample_audio(audio.astype(np.float32), sample_rate, target_sr)
+
+def invalidate_speaker_embedding(voice_id):
+    """Drop a voice from the in-memory embedding cache"""
+    with speaker_embedding_lock:
+        speaker_embedding_cache.pop(voice_id, None)
+    if synthesis_replica_pool is not None:
+        synthesis_replica_pool.invalidate(voice_id)
+
+class SynthesisInterrupted(Exception):
+    """Synthesis stopped because the client left ("cancelled") or the deadline passed ("timeout")"""
+    
+    def __init__(self, reason):
+        super().__init__(f"Synthesis {reason}")
+        self.reason = reason
+
+class RequestInterrupt:
+    """Deadline and client-disconnect state of one /tts request, shared by all of its chunks"""
+    
+    def __init__(self, deadline=None, disconnected=None):
+        self.deadline = deadline
+        self.disconnected = disconnected
+        self.reason = None
+    
+    def check(self):
+        """The reason to stop, or None while the request should go on"""
+        if self.reason is None:
+            if self.disconnected is not None and self.disconnected():
+                self.reason = "cancelled"
+            elif self.deadline is not None and time.time() >= self.deadline:
+                self.reason = "timeout"
+        return self.reason
+
+def get_disconnect_check():
+    """Callable telling whether the client of the current request has hung up, or None if the server can't tell"""
+    connection = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    if connection is None:
+        return None
+    
+    def disconnected():
+        # The request body has been read, so a readable socket with no data means the peer closed it
+        try:
+            return connection.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError:
+            return True
+    return disconnected
+
+class SynthesisRequest:
+    """A pending synthesis request waiting to be picked up by the synthesis scheduler"""
+    
+    def __init__(self, text, voice_id, speed, deadline=None):
+        self.text = text
+        self.voice_id = voice_id
+        self.speed = speed
+        self.deadline = deadline
+        self.cancelled = False
+        self.audio_array = None
+        self.error = None
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+    
+    def complete(self, audio_array):
+        if self.done.is_set():
+            return
+        self.audio_array = audio_array
+        self.finished_at = time.time()
+        self.done.set()
+    
+    def fail(self, error):
+        if self.done.is_set():
+            return
+        self.error = error
+        self.finished_at = time.time()
+        ERRORS_TOTAL.inc()
+        self.done.set()
+    
+    def drop(self, reason):
+        """Finish without audio because the client left or the deadline passed"""
+        if self.done.is_set():
+            return
+        self.error = SynthesisInterrupted(reason)
+        self.finished_at = time.time()
+        self.done.set()
+    
+    def check_interrupted(self):
+        """Drop the request if it was cancelled or its deadline passed; True once it has been dropped"""
+        if self.cancelled:
+            self.drop("cancelled")
+        elif self.deadline is not None and time.time() >= self.deadline:
+            self.drop("timeout")
+        return isinstance(self.error, SynthesisInterrupted)
+
+def run_synthesis(synthesis_request):
+    """Synthesize one request on a synthesis worker"""
+    # Requests whose client left or whose deadline passed while queued never reach the model
+    if synthesis_request.check_interrupted():
+        return
+    voice_id = synthesis_request.voice_id
+    speed = synthesis_request.speed
+    
+    started_at = time.time()
+    synthesis_request.started_at = started_at
+    QUEUE_WAIT_SECONDS.observe(started_at - synthesis_request.enqueued_at)
+    
+    try:
+        if voice_id in PRESET_VOICE_IDS:
+            # Use built-in voice
+            audio_array = converter.tts(synthesis_request.text, voice_preset=voice_id, speed_modifier=speed)
+        elif converter_uses_embeddings:
+            # For custom voices, use the cached speaker embedding
+            audio_array = converter.tts(
+                synthesis_request.text, speaker_embedding=get_speaker_embedding(voice_id), speed_modifier=speed
+            )
+        else:
+            # Converters without embedding support clone from the reference recording on every call
+            audio_array = converter.tts_with_reference(
+                synthesis_request.text, get_reference_audio_path(voice_id), speed_modifier=speed
+            )
+        SYNTHESIS_SECONDS.observe(time.time() - started_at)
+        synthesis_request.complete(audio_array)
+    
+    except Exception as e:
+        logger.error(f"Error in speech synthesis: {e}")
+        synthesis_request.fail(e)
+
+def synthesis_scheduler_loop():
+    """Hand queued requests to the synthesis workers, which run them concurrently"""
+    while True:
+        synthesis_request = synthesis_queue.get()
+        # Block until a worker is free rather than queueing work the pool can't start yet
+        synthesis_slots.acquire()
+        future = synthesis_pool.submit(run_synthesis, synthesis_request)
+        future.add_done_callback(lambda _: synthesis_slots.release())
+
+def start_synthesis_scheduler():
+    """Start the background synthesis scheduler once"""
+    global synthesis_scheduler_thread, synthesis_pool, synthesis_slots
+    with synthesis_scheduler_lock:
+        if synthesis_scheduler_thread is None:
+            synthesis_pool = ThreadPoolExecutor(max_workers=SYNTHESIS_WORKERS, thread_name_prefix="synthesis")
+            synthesis_slots = threading.Semaphore(SYNTHESIS_WORKERS)
+            synthesis_scheduler_thread = threading.Thread(
+                target=synthesis_scheduler_loop, name="synthesis-scheduler", daemon=True
+            )
+            synthesis_scheduler_thread.start()
+            logger.info(f"Synthesis scheduler started ({SYNTHESIS_WORKERS} workers)")
+
+def run_replica_synthesis(request_id, text, voice_id, speed, deadline, results, active_requests):
+    """Synthesize one request inside a replica and send the audio back to the parent"""
+    synthesis_request = SynthesisRequest(text, voice_id, speed, deadline)
+    try:
+        synthesis_queue.put_nowait(synthesis_request)
+    except queue.Full:
+        results.put((request_id, "busy", None))
+        return
+    active_requests[request_id] = synthesis_request
+    synthesis_request.done.wait()
+    active_requests.pop(request_id, None)
+    
+    if isinstance(synthesis_request.error, SynthesisInterrupted):
+        results.put((request_id, "interrupted", synthesis_request.error.reason))
+    elif synthesis_request.error is not None:
+        results.put((request_id, "error", str(synthesis_request.error)))
+    else:
+        audio_array = np.asarray(synthesis_request.audio_array, dtype=np.float32)
+        results.put((request_id, "done", (audio_array, synthesis_request.started_at)))
+
+def collect_metric_samples():
+    """Counter and histogram samples of this process by family name, keyed by (sample name, labels)"""
+    families = {}
+    for family in REGISTRY.collect():
+        if family.type not in ("counter", "histogram"):
+            continue
+        samples = families.setdefault(family.name, {})
+        for sample in family.samples:
+            # Creation timestamps don't add up across processes
+            if sample.name.endswith("_created"):
+                continue
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return families
+
+def forward_replica_metrics(index, results, baseline):
+    """Periodically send the parent what this replica counted and observed since the fork"""
+    while True:
+        time.sleep(METRICS_FORWARD_SECONDS)
+        deltas = {}
+        for name, samples in collect_metric_samples().items():
+            inherited = baseline.get(name, {})
+            deltas[name] = {key: value - inherited.get(key, 0.0) for key, value in samples.items()}
+        results.put((None, "metrics", (index, deltas)))
+
+class ReplicaMetrics:
+    """Registry view adding the counters and histograms of the replicas to those of the serving process"""
+    
+    def __init__(self, totals):
+        self.totals = totals
+    
+    def collect(self):
+        for family in REGISTRY.collect():
+            replica_samples = self.totals.get(family.name)
+            if not replica_samples:
+                yield family
+                continue
+            
+            merged = Metric(family.name, family.documentation, family.type, family.unit)
+            seen = set()
+            for sample in family.samples:
+                key = (sample.name, tuple(sorted(sample.labels.items())))
+                seen.add(key)
+                merged.add_sample(sample.name, sample.labels, sample.value + replica_samples.get(key, 0.0), sample.timestamp, sample.exemplar)
+            # Label sets only ever observed in a replica
+            for (name, labels), value in replica_samples.items():
+                if (name, labels) not in seen:
+                    merged.add_sample(name, dict(labels), value)
+            yield merged
+
+def synthesis_replica_main(index, inbox, results, parent_pid):
+    """Entry point of a forked replica: synthesize over the inherited weights and serve the parent"""
+    global synthesis_scheduler_thread, synthesis_pool, is_synthesis_replica
+    
+    # A scheduler thread or worker pool started in the parent before the fork does not exist here
+    synthesis_scheduler_thread = None
+    synthesis_pool = None
+    is_synthesis_replica = True
+    configure_cpu_runtime(index)
+    # The registry was copied from the parent, whose own samples are already in its /metrics
+    baseline = collect_metric_samples()
+    threading.Thread(target=forward_replica_metrics, args=(index, results, baseline), name="replica-metrics", daemon=True).start()
+    start_synthesis_scheduler()
+    if WARMUP_ENABLED:
+        try:
+            warmup_models()
+        except Exception as e:
+            logger.error(f"Error during warmup of replica {index}: {e}")
+    results.put((None, "ready", index))
+    logger.info(f"Synthesis replica {index} started (pid {os.getpid()})")
+    active_requests = {}
+    
+    while True:
+        try:
+            message = inbox.get(timeout=1)
+        except queue.Empty:
+            # Exit with the parent instead of lingering as an orphan
+            if os.getppid() != parent_pid:
+                return
+            continue
         
-        # Create converter
-        converter = ToneColorConverter(base_model, speaker_encoder, vocoder)
+        if message[0] == "invalidate":
+            invalidate_speaker_embedding(message[1])
+            continue
+        if message[0] == "voice":
+            # Re-read the entry the parent added, updated or removed
+            if os.path.isdir(os.path.join(CUSTOM_VOICES_PATH, message[1])):
+                add_voice_to_index(message[1])
+            else:
+                remove_voice_from_index(message[1])
+            continue
+        if message[0] == "cancel":
+            synthesis_request = active_requests.get(message[1])
+            if synthesis_request is not None:
+                synthesis_request.cancelled = True
+            continue
+        _, request_id, text, voice_id, speed, deadline = message
+        threading.Thread(
+            target=run_replica_synthesis,
+            args=(request_id, text, voice_id, speed, deadline, results, active_requests),
+            daemon=True
+        ).start()
+
+class SynthesisReplicaPool:
+    """Synthesis processes forked after the models are loaded, so read-only weights are shared copy-on-write"""
+    
+    def __init__(self, count):
+        context = multiprocessing.get_context("fork")
+        self.results = context.Queue()
+        self.inboxes = []
+        self.processes = []
+        for index in range(count):
+            inbox = context.Queue()
+            process = context.Process(
+                target=synthesis_replica_main,
+                args=(index, inbox, self.results, os.getpid()),
+                name=f"tts-replica-{index}",
+                daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
         
-        # Configure TTS settings
-        use_custom_voice = voice_id not in ["default", "warm", "bright", "calm"]
+        self.in_flight = [0] * count
+        self.pending = {}
+        self.ready = set()
+        self.all_ready = threading.Event()
+        self.replica_metrics = {}
+        self.request_ids = itertools.count()
+        self.lock = threading.Lock()
+        # Threads are started only after every fork so no replica inherits a held lock
+        threading.Thread(target=self.collect_results, name="replica-results", daemon=True).start()
+    
+    def wait_ready(self):
+        """Block until every replica has warmed up, or until the live ones have"""
+        while not self.all_ready.wait(timeout=1):
+            if all(index in self.ready or not process.is_alive() for index, process in enumerate(self.processes)):
+                break
+        if not self.ready:
+            raise RuntimeError("No synthesis replica started")
+    
+    def submit(self, synthesis_request):
+        """Dispatch a request to the least-loaded live replica; raises queue.Full when all are saturated"""
+        with self.lock:
+            alive = [index for index, process in enumerate(self.processes) if process.is_alive()]
+            if not alive:
+                raise RuntimeError("No synthesis replicas are running")
+            index = min(alive, key=lambda candidate: self.in_flight[candidate])
+            if self.in_flight[index] >= TTS_MAX_QUEUE_DEPTH:
+                raise queue.Full
+            request_id = next(self.request_ids)
+            self.pending[request_id] = (index, synthesis_request)
+            self.in_flight[index] += 1
+            REPLICA_IN_FLIGHT.labels(str(index)).set(self.in_flight[index])
         
-        # For custom voices, load the reference audio
-        if use_custom_voice:
-            voice_dir = os.path.join(CUSTOM_VOICES_PATH, voice_id)
-            if not os.path.exists(voice_dir):
-                logger.error(f"Custom voice directory not found: {voice_dir}")
-                raise ValueError(f"Voice not found: {voice_id}")
-            
-            # Find reference audio file
-            reference_files = list(Path(voice_dir).glob("*.wav"))
-            if not reference_files:
-                logger.error(f"No reference audio found in {voice_dir}")
-                raise ValueError(f"No reference audio found for voice: {voice_id}")
+        self.inboxes[index].put((
+            "synthesize", request_id, synthesis_request.text, synthesis_request.voice_id, synthesis_request.speed,
+            synthesis_request.deadline
+        ))
+    
+    def cancel(self, synthesis_request):
+        """Forward a cancellation to the replica running the request"""
+        with self.lock:
+            for request_id, (index, pending_request) in self.pending.items():
+                if pending_request is synthesis_request:
+                    break
+            else:
+                return
+        self.inboxes[index].put(("cancel", request_id))
+    
+    def invalidate(self, voice_id):
+        """Drop a voice's cached embedding in every replica"""
+        for inbox in self.inboxes:
+            inbox.put(("invalidate", voice_id))
+    
+    def update_voice(self, voice_id):
+        """Have every replica re-read a voice's catalog entry"""
+        for inbox in self.inboxes:
+            inbox.put(("voice", voice_id))
+    
+    def complete(self, request_id):
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+            if entry is None:
+                return None
+            index, synthesis_request = entry
+            self.in_flight[index] -= 1
+            REPLICA_IN_FLIGHT.labels(str(index)).set(self.in_flight[index])
+        return synthesis_request
+    
+    def fail_dead_replicas(self):
+        """Fail the requests of replicas that exited so their clients don't wait forever"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            with self.lock:
+                request_ids = [request_id for request_id, (owner, _) in self.pending.items() if owner == index]
+            for request_id in request_ids:
+                synthesis_request = self.complete(request_id)
+                if synthesis_request is not None:
+                    logger.error(f"Synthesis replica {index} exited with code {process.exitcode}")
+                    synthesis_request.fail(RuntimeError(f"Synthesis replica {index} exited"))
+    
+    def collect_results(self):
+        while True:
+            try:
+                request_id, kind, value = self.results.get(timeout=1)
+            except queue.Empty:
+                self.fail_dead_replicas()
+                continue
             
-            reference_audio_path = str(reference_files[0])
+            if kind == "ready":
+                self.ready.add(value)
+                if len(self.ready) == len(self.processes):
+                    self.all_ready.set()
+                continue
+            if kind == "metrics":
+                index, families = value
+                self.replica_metrics[index] = families
+                continue
             
-            # Generate speech with custom voice
-            audio_array = converter.tts_with_reference(
-                text,
-                reference_audio_path,
-                speed_modifier=speed
-            )
+            synthesis_request = self.complete(request_id)
+            if synthesis_request is None:
+                continue
+            if kind == "done":
+                audio_array, synthesis_request.started_at = value
+                synthesis_request.complete(audio_array)
+            elif kind == "busy":
+                synthesis_request.fail(queue.Full())
+            elif kind == "interrupted":
+                synthesis_request.drop(value)
+            else:
+                synthesis_request.fail(RuntimeError(value))
+    
+    def total_in_flight(self):
+        with self.lock:
+            return sum(self.in_flight)
+    
+    def stats(self):
+        with self.lock:
+            return [
+                {"index": index, "pid": process.pid, "alive": process.is_alive(), "in_flight": self.in_flight[index]}
+                for index, process in enumerate(self.processes)
+            ]
+    
+    def metric_totals(self):
+        """Counter and histogram samples forwarded by the replicas, summed over them"""
+        totals = {}
+        for families in list(self.replica_metrics.values()):
+            for name, samples in families.items():
+                family_totals = totals.setdefault(name, {})
+                for key, value in samples.items():
+                    family_totals[key] = family_totals.get(key, 0.0) + value
+        return totals
+
+def get_queue_depth():
+    """Requests waiting for the scheduler, or all requests dispatched to the replicas when there are any"""
+    if synthesis_replica_pool is not None:
+        return synthesis_replica_pool.total_in_flight()
+    return synthesis_queue.qsize()
+
+QUEUE_DEPTH.set_function(get_queue_depth)
+
+def add_timing(timings, name, seconds):
+    """Accumulate a stage duration in milliseconds into an optional timings dict"""
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+def synthesize_audio(text, voice_id="default", speed=1.0, timings=None, interrupt=None):
+    """Synthesize speech from text and return the raw float audio array
+    
+    Raises queue.Full when saturated, and SynthesisInterrupted once the interrupt fires.
+    """
+    ensure_models_loaded()
+    
+    if interrupt is not None and interrupt.check():
+        INTERRUPTED_TOTAL.labels(interrupt.reason, "queued").inc()
+        raise SynthesisInterrupted(interrupt.reason)
+    
+    synthesis_request = SynthesisRequest(text, voice_id, speed, interrupt.deadline if interrupt is not None else None)
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        if synthesis_replica_pool is not None:
+            synthesis_replica_pool.submit(synthesis_request)
         else:
-            # Use built-in voice
-            audio_array = converter.tts(
-                text,
-                voice_preset=voice_id,
-                speed_modifier=speed
-            )
+            start_synthesis_scheduler()
+            synthesis_queue.put_nowait(synthesis_request)
+    except queue.Full:
+        REQUESTS_IN_FLIGHT.dec()
+        REJECTED_TOTAL.inc()
+        raise
+    
+    reason = None
+    while not synthesis_request.done.wait(timeout=DISCONNECT_POLL_SECONDS if interrupt is not None else None):
+        reason = interrupt.check()
+        if reason is not None:
+            # The scheduler skips the request if it hasn't started; a running chunk's audio is discarded
+            synthesis_request.cancelled = True
+            if synthesis_replica_pool is not None:
+                synthesis_replica_pool.cancel(synthesis_request)
+            break
+    REQUESTS_IN_FLIGHT.dec()
+    
+    if reason is None and isinstance(synthesis_request.error, SynthesisInterrupted):
+        reason = synthesis_request.error.reason
+    if reason is not None:
+        INTERRUPTED_TOTAL.labels(reason, "queued" if synthesis_request.started_at is None else "running").inc()
+        raise SynthesisInterrupted(reason)
+    
+    started_at = synthesis_request.started_at or synthesis_request.enqueued_at
+    add_timing(timings, "queue_ms", started_at - synthesis_request.enqueued_at)
+    add_timing(timings, "inference_ms", synthesis_request.finished_at - started_at)
+    
+    if synthesis_request.error is not None:
+        raise synthesis_request.error
+    return synthesis_request.audio_array
+
+def synthesize_speech(text, voice_id="default", speed=1.0):
+    """Synthesize speech from text using the specified voice"""
+    audio_array = synthesize_audio(text, voice_id, speed)
+    
+    # Save to in-memory file
+    buffer = io.BytesIO()
+    sf.write(buffer, audio_array, DEFAULT_SAMPLING_RATE, format='WAV')
+    buffer.seek(0)
+    
+    return buffer
+
+def is_abbreviation(text, next_text=""):
+    """Whether text ends in an abbreviation or an initial rather than the end of a sentence"""
+    if not text.endswith("."):
+        return False
+    word = text.rsplit(None, 1)[-1][:-1].lower()
+    if word in NUMBER_ABBREVIATIONS:
+        return next_text[:1].isdigit()
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+def split_text_into_chunks(text, max_chars=STREAM_CHUNK_MAX_CHARS):
+    """Split text into sentences, breaking long sentences at clause boundaries"""
+    # Rejoin splits made after abbreviations and initials ("Dr. Smith", "J. R. Tolkien")
+    sentences = []
+    for piece in re.split(r'(?<=[.!?])\s+', text.strip()):
+        if sentences and is_abbreviation(sentences[-1], piece):
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    
+    chunks = []
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            chunks.append(sentence)
+            continue
         
-        # Save to in-memory file
+        # Long sentences are broken at commas/semicolons so the first audio arrives sooner
+        current = ""
+        for clause in re.split(r'(?<=[,;:])\s+', sentence):
+            if current and len(current) + len(clause) + 1 > max_chars:
+                chunks.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            chunks.append(current)
+    
+    return chunks
+
+def pcm16_bytes(audio_array):
+    """Convert a float audio array to little-endian 16-bit PCM bytes"""
+    audio_array = np.clip(np.asarray(audio_array, dtype=np.float32), -1.0, 1.0)
+    return (audio_array * 32767).astype('<i2').tobytes()
+
+def wav_stream_header(sample_rate, channels=1, bits_per_sample=16):
+    """Build a WAV header for a stream whose total length is not known up front"""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b'data' + struct.pack('<I', 0xFFFFFFFF)
+    )
+
+def get_output_sample_rate(format):
+    """Sample rate of the encoded output, Opus is always produced at 48 kHz"""
+    return OPUS_SAMPLING_RATE if format == 'opus' else DEFAULT_SAMPLING_RATE
+
+def get_audio_mimetype(format):
+    """MIME type for an output format"""
+    if format == 'pcm':
+        return f'audio/L16;rate={DEFAULT_SAMPLING_RATE};channels=1'
+    return AUDIO_MIMETYPES.get(format, f'audio/{format}')
+
+def resample_audio(audio_array, orig_sr, target_sr):
+    """Resample audio with a polyphase filter"""
+    if orig_sr == target_sr:
+        return audio_array
+    divisor = gcd(orig_sr, target_sr)
+    return resample_poly(audio_array, target_sr // divisor, orig_sr // divisor).astype(np.float32)
+
+def encode_audio_array(audio_array, format):
+    """Encode a float audio array in the requested format"""
+    audio_array = np.asarray(audio_array, dtype=np.float32)
+    
+    if format == 'pcm':
+        return pcm16_bytes(audio_array)
+    
+    if format in SOUNDFILE_FORMATS:
+        container, subtype = SOUNDFILE_FORMATS[format]
+        sample_rate = get_output_sample_rate(format)
         buffer = io.BytesIO()
-        sf.write(buffer, audio_array, DEFAULT_SAMPLING_RATE, format='WAV')
-        buffer.seek(0)
+        sf.write(
+            buffer,
+            resample_audio(audio_array, DEFAULT_SAMPLING_RATE, sample_rate),
+            sample_rate,
+            format=container,
+            subtype=subtype
+        )
+        return buffer.getvalue()
+    
+    # Formats libsndfile can't write still go through pydub/ffmpeg
+    wav_buffer = io.BytesIO()
+    sf.write(wav_buffer, audio_array, DEFAULT_SAMPLING_RATE, format='WAV')
+    wav_buffer.seek(0)
+    format_buffer = io.BytesIO()
+    AudioSegment.from_wav(wav_buffer).export(format_buffer, format=format)
+    return format_buffer.getvalue()
+
+def encode_audio(audio_array, format):
+    """Encode audio on the encoder pool"""
+    with ENCODE_SECONDS.labels(format).time():
+        return encoder_pool.submit(encode_audio_array, audio_array, format).result()
+
+def stream_speech(text, voice_id="default", speed=1.0, format="wav", interrupt=None):
+    """Synthesize text sentence by sentence and yield audio as each chunk is ready
+    
+    Nothing is yielded before the first chunk is synthesized, and its errors propagate, so a caller that
+    primes the generator can still answer with an error status. A later failure raises after the audio
+    sent so far, which ends the response without its terminating chunk.
+    """
+    start_time = time.time()
+    
+    header = wav_stream_header(DEFAULT_SAMPLING_RATE) if format == 'wav' else b""
+    opus_buffer = None
+    opus_writer = None
+    opus_sent = 0
+    if format == 'opus':
+        # Ogg pages are flushed into the buffer as they fill, so they can be sent incrementally
+        opus_buffer = io.BytesIO()
+        opus_writer = sf.SoundFile(
+            opus_buffer, 'w', samplerate=OPUS_SAMPLING_RATE, channels=1, format='OGG', subtype='OPUS'
+        )
+    
+    def take_opus_bytes():
+        nonlocal opus_sent
+        position = opus_buffer.tell()
+        opus_buffer.seek(opus_sent)
+        data = opus_buffer.read()
+        opus_buffer.seek(position)
+        opus_sent += len(data)
+        return data
+    
+    error = None
+    try:
+        for index, chunk in enumerate(split_text_into_chunks(text)):
+            try:
+                audio_array = synthesize_audio(chunk, voice_id, speed, interrupt=interrupt)
+            except SynthesisInterrupted as e:
+                if index == 0:
+                    raise
+                # The audio sent so far stays valid; the stream just ends early
+                logger.info(f"Streaming synthesis stopped at chunk {index}: {e}")
+                break
+            except Exception as e:
+                if index == 0:
+                    raise
+                logger.error(f"Error in streaming synthesis at chunk {index}: {e}")
+                error = e
+                break
+            
+            if index == 0:
+                logger.info(f"Time to first audio: {time.time() - start_time:.3f}s")
+                TIME_TO_FIRST_AUDIO_SECONDS.observe(time.time() - start_time)
+            
+            if opus_writer is not None:
+                opus_writer.write(resample_audio(np.asarray(audio_array, dtype=np.float32), DEFAULT_SAMPLING_RATE, OPUS_SAMPLING_RATE))
+                data = take_opus_bytes()
+            else:
+                data = pcm16_bytes(audio_array)
+            # The first chunk is always yielded, even while the Opus encoder is still buffering
+            if data or index == 0:
+                yield header + data
+                header = b""
+    finally:
+        if opus_writer is not None:
+            opus_writer.close()
+    
+    # Also after an early stop: closing the encoder flushes its buffered audio and the end-of-stream page
+    if opus_writer is not None:
+        data = take_opus_bytes()
+        if data:
+            yield data
+    
+    if error is not None:
+        raise RuntimeError(f"Streaming synthesis failed: {error}")
+    
+    logger.info(f"Streamed synthesis finished in {time.time() - start_time:.3f}s")
+    REQUEST_SECONDS.labels("stream").observe(time.time() - start_time)
+
+def render_audio(text, voice_id="default", speed=1.0, format="wav", timings=None, interrupt=None):
+    """Synthesize text and encode it in the requested format"""
+    audio_array = synthesize_audio(text, voice_id, speed, timings, interrupt)
+    start_time = time.time()
+    audio_bytes = encode_audio(audio_array, format)
+    add_timing(timings, "encode_ms", time.time() - start_time)
+    return audio_bytes
+
+def split_long_form_text(text, max_chars=LONGFORM_SEGMENT_CHARS):
+    """Group sentences into segments of up to max_chars so each synthesis call keeps natural prosody"""
+    segments = []
+    current = ""
+    for sentence in split_text_into_chunks(text, max_chars):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+def synthesize_segments(segments, voice_id, speed, timings=None, interrupt=None):
+    """Synthesize segments concurrently and yield their audio in order
+    
+    Segments are synthesized in parallel by the scheduler's worker threads, or by the replicas in replica
+    mode; this pool only keeps them submitted. At most LONGFORM_PARALLELISM segments are in flight or
+    waiting to be consumed, which bounds memory regardless of the number of segments.
+    """
+    def take_result():
+        # Each segment records its own timings; they are merged here on the consuming thread
+        future, segment_timings = in_flight.popleft()
+        audio_array = future.result()
+        for name, milliseconds in segment_timings.items():
+            add_timing(timings, name, milliseconds / 1000)
+        return audio_array
+    
+    with ThreadPoolExecutor(max_workers=LONGFORM_PARALLELISM, thread_name_prefix="longform") as pool:
+        in_flight = deque()
+        try:
+            for segment in segments:
+                segment_timings = {}
+                in_flight.append((
+                    pool.submit(synthesize_audio, segment, voice_id, speed, segment_timings, interrupt),
+                    segment_timings
+                ))
+                if len(in_flight) >= LONGFORM_PARALLELISM:
+                    yield take_result()
+            while in_flight:
+                yield take_result()
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+
+def normalize_loudness(audio_array, target_dbfs=LONGFORM_TARGET_DBFS):
+    """Scale audio to a target RMS level measured over non-silent samples, never past full scale"""
+    audio_array = np.asarray(audio_array, dtype=np.float32)
+    voiced = audio_array[np.abs(audio_array) > 1e-3]
+    if voiced.size == 0:
+        return audio_array
+    
+    gain = 10 ** (target_dbfs / 20) / np.sqrt(np.mean(voiced ** 2))
+    gain = min(gain, 0.99 / np.max(np.abs(audio_array)))
+    return audio_array * gain
+
+def stitch_segments(audio_arrays, crossfade_samples):
+    """Join segments with short equal-power crossfades, yielding audio as soon as it is final"""
+    tail = None
+    for audio_array in audio_arrays:
+        if tail is not None:
+            overlap = min(len(tail), len(audio_array), crossfade_samples)
+            if overlap:
+                angle = np.linspace(0, np.pi / 2, overlap, dtype=np.float32)
+                yield tail[:len(tail) - overlap]
+                yield tail[len(tail) - overlap:] * np.cos(angle) + audio_array[:overlap] * np.sin(angle)
+                audio_array = audio_array[overlap:]
+            else:
+                yield tail
         
-        return buffer
+        # The end of each segment is held back to fade into the next one
+        split = max(0, len(audio_array) - crossfade_samples)
+        yield audio_array[:split]
+        tail = audio_array[split:]
     
-    except Exception as e:
-        logger.error(f"Error in speech synthesis: {e}")
+    if tail is not None:
+        yield tail
+
+def render_long_form(text, voice_id="default", speed=1.0, format="wav", timings=None, interrupt=None):
+    """Synthesize long text in parallel segments and encode the stitched audio into a spooled file
+    
+    Returns the file positioned at its start and the number of segments.
+    """
+    segments = split_long_form_text(text)
+    sample_rate = get_output_sample_rate(format)
+    
+    # Segments are resampled before stitching so block boundaries never need filtering
+    prepared = (
+        resample_audio(normalize_loudness(audio_array), DEFAULT_SAMPLING_RATE, sample_rate)
+        for audio_array in synthesize_segments(segments, voice_id, speed, timings, interrupt)
+    )
+    stitched = stitch_segments(prepared, int(sample_rate * LONGFORM_CROSSFADE_MS / 1000))
+    
+    # Encoded output goes to disk past the spool size, so memory stays flat for any text length
+    output = tempfile.SpooledTemporaryFile(max_size=LONGFORM_SPOOL_BYTES)
+    try:
+        if format == 'pcm':
+            for block in stitched:
+                output.write(pcm16_bytes(block))
+        else:
+            container, subtype = SOUNDFILE_FORMATS[format]
+            with sf.SoundFile(output, 'w', samplerate=sample_rate, channels=1, format=container, subtype=subtype) as writer:
+                for block in stitched:
+                    if len(block):
+                        writer.write(block)
+    except BaseException:
+        output.close()
         raise
+    
+    output.seek(0)
+    return output, len(segments)
+
+def normalize_cache_text(text):
+    """Collapse whitespace so trivially different prompts share a cache entry"""
+    return " ".join(text.split())
+
+def get_audio_cache_key(text, voice_id, speed, format):
+    """Content address of a synthesized clip"""
+    key = json.dumps([normalize_cache_text(text), voice_id, float(speed), format, get_output_sample_rate(format)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def get_audio_cache_dir(voice_id):
+    """Disk tier directory for a voice, or None if the id isn't safe to use as a path"""
+    if not re.fullmatch(r'[\w.-]+', voice_id) or voice_id in ('.', '..'):
+        return None
+    return os.path.join(AUDIO_CACHE_PATH, voice_id)
+
+def store_in_memory_cache(key, voice_id, audio_bytes):
+    """Add a clip to the in-memory LRU, evicting the least recently used clips past the size limit"""
+    global audio_cache_bytes
+    
+    if len(audio_bytes) > AUDIO_CACHE_MAX_BYTES:
+        return
+    
+    with audio_cache_lock:
+        if key in audio_cache:
+            audio_cache_bytes -= len(audio_cache.pop(key)[1])
+        audio_cache[key] = (voice_id, audio_bytes)
+        audio_cache_bytes += len(audio_bytes)
+        while audio_cache_bytes > AUDIO_CACHE_MAX_BYTES:
+            _, (_, evicted) = audio_cache.popitem(last=False)
+            audio_cache_bytes -= len(evicted)
+
+def lookup_cached_audio(key, voice_id, format):
+    """Look a clip up in memory, then on disk; returns None on a miss"""
+    with audio_cache_lock:
+        if key in audio_cache:
+            audio_cache.move_to_end(key)
+            audio_cache_stats["memory_hits"] += 1
+            AUDIO_CACHE_LOOKUPS_TOTAL.labels("memory_hit").inc()
+            return audio_cache[key][1]
+    
+    cache_dir = get_audio_cache_dir(voice_id)
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"{key}.{format}")
+        try:
+            with open(cache_path, 'rb') as f:
+                audio_bytes = f.read()
+            # The modification time orders disk evictions, so a hit marks the clip as recently used
+            os.utime(cache_path)
+        except FileNotFoundError:
+            pass
+        else:
+            store_in_memory_cache(key, voice_id, audio_bytes)
+            with audio_cache_lock:
+                audio_cache_stats["disk_hits"] += 1
+            AUDIO_CACHE_LOOKUPS_TOTAL.labels("disk_hit").inc()
+            return audio_bytes
+    
+    with audio_cache_lock:
+        audio_cache_stats["misses"] += 1
+    AUDIO_CACHE_LOOKUPS_TOTAL.labels("miss").inc()
+    return None
+
+def store_cached_audio(key, voice_id, format, audio_bytes):
+    """Store a clip in both cache tiers"""
+    store_in_memory_cache(key, voice_id, audio_bytes)
+    
+    cache_dir = get_audio_cache_dir(voice_id)
+    if cache_dir is None:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_path = os.path.join(cache_dir, f"{key}.{format}")
+        temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(audio_bytes)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write audio cache entry {key}: {e}")
+        return
+    add_disk_cache_bytes(len(audio_bytes))
+
+def list_disk_cache_entries():
+    """(modification time, size, path) of every clip in the disk tier"""
+    entries = []
+    for voice_dir in os.scandir(AUDIO_CACHE_PATH):
+        if not voice_dir.is_dir():
+            continue
+        for entry in os.scandir(voice_dir.path):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+def add_disk_cache_bytes(size):
+    """Account for a clip written to disk, evicting the least recently used clips past the disk size limit"""
+    global audio_cache_disk_bytes
+    
+    with audio_cache_disk_lock:
+        if audio_cache_disk_bytes is None:
+            # The scan already includes the clip just written
+            audio_cache_disk_bytes = sum(entry_size for _, entry_size, _ in list_disk_cache_entries())
+        else:
+            audio_cache_disk_bytes += size
+        if audio_cache_disk_bytes <= AUDIO_CACHE_DISK_MAX_BYTES:
+            return
+        
+        # Evict down to 90% of the limit so the directory isn't rescanned on every write
+        entries = sorted(list_disk_cache_entries())
+        audio_cache_disk_bytes = sum(entry_size for _, entry_size, _ in entries)
+        evicted = 0
+        for _, entry_size, path in entries:
+            if audio_cache_disk_bytes <= AUDIO_CACHE_DISK_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            audio_cache_disk_bytes -= entry_size
+            evicted += 1
+    
+    with audio_cache_lock:
+        audio_cache_stats["disk_evictions"] += evicted
+    logger.info(f"Evicted {evicted} clips from the disk audio cache")
+
+def invalidate_cached_audio(voice_id):
+    """Drop every cached clip of a voice from both tiers"""
+    global audio_cache_bytes, audio_cache_disk_bytes
+    
+    with audio_cache_lock:
+        for key in [key for key, (cached_voice_id, _) in audio_cache.items() if cached_voice_id == voice_id]:
+            audio_cache_bytes -= len(audio_cache.pop(key)[1])
+    
+    cache_dir = get_audio_cache_dir(voice_id)
+    if cache_dir is not None and os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        # Rescanned on the next write
+        with audio_cache_disk_lock:
+            audio_cache_disk_bytes = None
+
+def get_or_render_audio(text, voice_id="default", speed=1.0, format="wav", use_cache=True, timings=None, interrupt=None):
+    """Return encoded audio from the cache, rendering and caching it on a miss"""
+    if not AUDIO_CACHE_ENABLED or not use_cache or not format.isalnum():
+        return render_audio(text, voice_id, speed, format, timings, interrupt)
+    
+    key = get_audio_cache_key(text, voice_id, speed, format)
+    audio_bytes = lookup_cached_audio(key, voice_id, format)
+    if audio_bytes is None:
+        audio_bytes = render_audio(text, voice_id, speed, format, timings, interrupt)
+        store_cached_audio(key, voice_id, format, audio_bytes)
+    return audio_bytes
+
+def get_job_dir(job_id):
+    """Directory of a job, or None if the id isn't a job id"""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    return os.path.join(JOBS_PATH, job_id)
+
+def write_json_atomic(path, data):
+    """Write JSON so a concurrent reader or a crash never leaves a partial file"""
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def save_job_status(job):
+    with jobs_lock:
+        status = dict(job, errors=list(job["errors"]))
+    write_json_atomic(os.path.join(get_job_dir(job["id"]), "status.json"), status)
+
+def get_job_summary(job):
+    """Public view of a job with its progress"""
+    with jobs_lock:
+        summary = dict(job, errors=list(job["errors"]))
+    done = summary["completed"] + summary["failed"]
+    summary["progress"] = round(done / summary["total"], 4) if summary["total"] else 1.0
+    return summary
+
+def validate_job_items(items, defaults):
+    """Normalize manifest items, returning (items, error message)"""
+    if not isinstance(items, list) or not items:
+        return None, "A non-empty list of items is required"
+    if len(items) > JOB_MAX_ITEMS:
+        return None, f"At most {JOB_MAX_ITEMS} items per job"
+    
+    normalized = []
+    names = set()
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"text": item}
+        if not isinstance(item, dict) or not isinstance(item.get('text'), str) or not item['text'].strip():
+            return None, f"Item {index} needs a text"
+        
+        format = str(item.get('format', defaults['format'])).lower()
+        if format not in SOUNDFILE_FORMATS and format != 'pcm':
+            return None, f"Item {index} has an unsupported format: {format}"
+        try:
+            speed = float(item.get('speed', defaults['speed']))
+        except (TypeError, ValueError):
+            return None, f"Item {index} has an invalid speed"
+        
+        # Output files are named after the item, or numbered in manifest order
+        name = str(item.get('name') or f"{index:05d}")
+        if not re.fullmatch(r'[\w.-]+', name) or name in ('.', '..'):
+            return None, f"Item {index} has an invalid name: {name}"
+        filename = f"{name}.{format}"
+        if filename in names:
+            return None, f"Duplicate item name: {name}"
+        names.add(filename)
+        
+        normalized.append({
+            "text": item['text'],
+            "voice": str(item.get('voice', defaults['voice'])),
+            "speed": speed,
+            "format": format,
+            "filename": filename
+        })
+    return normalized, None
+
+def create_job(items):
+    """Persist a new job's manifest and status, then queue it"""
+    job_id = uuid.uuid4().hex
+    job_dir = get_job_dir(job_id)
+    os.makedirs(os.path.join(job_dir, "output"))
+    write_json_atomic(os.path.join(job_dir, "manifest.json"), items)
+    
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "total": len(items),
+        "completed": 0,
+        "failed": 0,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "started_at": None,
+        "finished_at": None,
+        "errors": []
+    }
+    with jobs_lock:
+        jobs[job_id] = job
+    save_job_status(job)
+    job_queue.put(job_id)
+    return job
+
+def load_jobs():
+    """Load job statuses from disk and requeue jobs interrupted by a restart"""
+    for job_id in sorted(os.listdir(JOBS_PATH)):
+        job_dir = get_job_dir(job_id)
+        status_path = os.path.join(job_dir, "status.json") if job_dir else None
+        if status_path is None or not os.path.exists(status_path):
+            continue
+        try:
+            with open(status_path, 'r') as f:
+                job = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable job {job_id}: {e}")
+            continue
+        
+        with jobs_lock:
+            jobs[job_id] = job
+        if job["status"] in ("queued", "running"):
+            # Items already written are skipped when the job resumes
+            job["status"] = "queued"
+            job_queue.put(job_id)
+    
+    if not job_queue.empty():
+        logger.info(f"Resuming {job_queue.qsize()} bulk synthesis jobs")
+
+def render_job_item(output_dir, item):
+    """Synthesize and encode one manifest item, waiting for room when the synthesis queue is full"""
+    while True:
+        try:
+            audio_array = synthesize_audio(item["text"], item["voice"], item["speed"])
+            break
+        except queue.Full:
+            time.sleep(RETRY_AFTER_SECONDS)
+    
+    output_path = os.path.join(output_dir, item["filename"])
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(encode_audio(audio_array, item["format"]))
+    os.replace(temp_path, output_path)
+
+def build_job_archive(job_dir):
+    """Zip a job's output directory; audio is already compressed, so entries are stored"""
+    archive_path = os.path.join(job_dir, "results.zip")
+    temp_path = f"{archive_path}.{uuid.uuid4().hex}.tmp"
+    output_dir = os.path.join(job_dir, "output")
+    with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename in sorted(os.listdir(output_dir)):
+            if not filename.endswith('.tmp'):
+                archive.write(os.path.join(output_dir, filename), filename)
+    os.replace(temp_path, archive_path)
+
+def run_job(job_id):
+    """Render every pending item of a job, keeping the synthesis scheduler saturated"""
+    job = jobs[job_id]
+    job_dir = get_job_dir(job_id)
+    output_dir = os.path.join(job_dir, "output")
+    with open(os.path.join(job_dir, "manifest.json"), 'r') as f:
+        items = json.load(f)
+    
+    # Same voice back to back, so its speaker embedding stays cached
+    order = sorted(
+        (index for index, item in enumerate(items) if not os.path.exists(os.path.join(output_dir, item["filename"]))),
+        key=lambda index: (items[index]["voice"], items[index]["speed"], len(items[index]["text"]))
+    )
+    with jobs_lock:
+        job["status"] = "running"
+        job["started_at"] = job["started_at"] or time.strftime("%Y-%m-%d %H:%M:%S")
+        # Failed items have no output file, so a resumed job retries them
+        job["completed"] = len(items) - len(order)
+        job["failed"] = 0
+        job["errors"] = []
+    save_job_status(job)
+    logger.info(f"Running bulk synthesis job {job_id}: {len(order)} of {len(items)} items pending")
+    
+    last_saved = time.time()
+    with ThreadPoolExecutor(max_workers=JOB_PARALLELISM, thread_name_prefix=f"job-{job_id[:8]}") as pool:
+        in_flight = {}
+        remaining = iter(order)
+        while True:
+            while len(in_flight) < JOB_PARALLELISM and job["status"] == "running":
+                index = next(remaining, None)
+                if index is None:
+                    break
+                in_flight[pool.submit(render_job_item, output_dir, items[index])] = index
+            if not in_flight:
+                break
+            
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            with jobs_lock:
+                for future in finished:
+                    index = in_flight.pop(future)
+                    if future.exception() is None:
+                        job["completed"] += 1
+                        continue
+                    job["failed"] += 1
+                    if len(job["errors"]) < JOB_MAX_ERRORS:
+                        job["errors"].append({"index": index, "error": str(future.exception())})
+            if time.time() - last_saved >= JOB_STATUS_INTERVAL:
+                save_job_status(job)
+                last_saved = time.time()
+    
+    if job["status"] == "cancelled":
+        shutil.rmtree(job_dir, ignore_errors=True)
+        with jobs_lock:
+            jobs.pop(job_id, None)
+        logger.info(f"Bulk synthesis job {job_id} cancelled")
+        return
+    
+    build_job_archive(job_dir)
+    with jobs_lock:
+        job["status"] = "completed" if job["completed"] else "failed"
+        job["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    save_job_status(job)
+    logger.info(f"Bulk synthesis job {job_id} finished: {job['completed']} completed, {job['failed']} failed")
+
+def job_worker_loop():
+    """Run queued bulk synthesis jobs one at a time"""
+    while True:
+        job_id = job_queue.get()
+        
+        # Wait for the startup phase instead of failing jobs queued while models load
+        while startup_state["status"] in ("loading", "warming_up"):
+            time.sleep(1)
+        
+        job = jobs.get(job_id)
+        if job is None or job["status"] != "queued":
+            continue
+        try:
+            run_job(job_id)
+        except Exception as e:
+            logger.error(f"Error in bulk synthesis job {job_id}: {e}")
+            with jobs_lock:
+                job["status"] = "failed"
+                job["errors"].append({"index": None, "error": str(e)})
+            if os.path.exists(get_job_dir(job_id)):
+                save_job_status(job)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({"status": "ok"}), 200
+    """Liveness check endpoint"""
+    return jsonify({"status": "ok", "startup": startup_state["status"]}), 200
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check endpoint, only OK once models are loaded and warmed up"""
+    status_code = 200 if startup_state["status"] == "ready" else 503
+    return jsonify(startup_state), status_code
 
 @app.route('/voices', methods=['GET'])
 def list_voices():
-    """List available voices"""
-    voices = get_available_voices()
-    return jsonify({"voices": voices})
+    """List available voices, optionally paginated with `limit` and `cursor`"""
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+    
+    refresh_voice_index()
+    
+    # Conditional GET: skip building the page if the client's copy is current
+    etag = get_voice_index_etag(cursor, limit)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    voices, next_cursor = get_voice_page(cursor, limit)
+    response = jsonify({"voices": voices, "next_cursor": next_cursor})
+    response.set_etag(etag)
+    return response
 
 @app.route('/tts', methods=['POST'])
 def text_to_speech():
@@ -221,35 +1841,284 @@ def text_to_speech():
     voice = data.get('voice', 'default')
     format = data.get('format', 'mp3')
     speed = float(data.get('speed', 1.0))
+    stream = bool(data.get('stream', False))
+    deadline_ms = data.get('deadline_ms')
     
     if not text:
         return jsonify({"error": "Text is required"}), 400
+    deadline = None
+    if deadline_ms is not None:
+        try:
+            deadline_ms = float(deadline_ms)
+        except (TypeError, ValueError):
+            deadline_ms = 0
+        if deadline_ms <= 0:
+            return jsonify({"error": "deadline_ms must be a positive number"}), 400
+        deadline = time.time() + deadline_ms / 1000.0
+    interrupt = RequestInterrupt(deadline, get_disconnect_check())
     
-    try:
-        # Generate speech
-        output_buffer = synthesize_speech(text, voice, speed)
+    if stream:
+        if format.lower() not in STREAMING_FORMATS:
+            return jsonify({"error": f"Streaming supports only {', '.join(STREAMING_FORMATS)} formats"}), 400
+        
+        if synthesis_queue.full():
+            logger.warning("Synthesis queue is full, rejecting request")
+            return (
+                jsonify({"error": "Server is busy, please retry later"}),
+                503,
+                {"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
         
-        # Convert to requested format if not WAV
-        if format.lower() != 'wav':
-            wav_audio = AudioSegment.from_wav(output_buffer)
+        try:
+            ensure_models_loaded()
+        except Exception as e:
+            logger.error(f"Error in TTS: {e}")
+            return jsonify({"error": str(e)}), 500
+        
+        if not voice_exists(voice):
+            return jsonify({"error": f"Voice not found: {voice}"}), 404
+        
+        # The first chunk is synthesized before the response starts, so its failures still get a status code
+        audio_chunks = stream_speech(text, voice, speed, format.lower(), interrupt)
+        try:
+            first_chunk = next(audio_chunks)
+        except StopIteration:
+            return jsonify({"error": "Text is required"}), 400
+        except SynthesisInterrupted as e:
+            return jsonify({"error": str(e), "finish_reason": e.reason}), 504
+        except queue.Full:
+            logger.warning("Synthesis queue is full, rejecting request")
+            return (
+                jsonify({"error": "Server is busy, please retry later"}),
+                503,
+                {"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+        except Exception as e:
+            logger.error(f"Error in streaming TTS: {e}")
+            return jsonify({"error": str(e)}), 500
+        
+        return Response(
+            stream_with_context(itertools.chain([first_chunk], audio_chunks)),
+            mimetype=get_audio_mimetype(format.lower()),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    long_form = data.get('long_form')
+    if long_form is None:
+        long_form = len(text) >= LONGFORM_MIN_CHARS
+    if long_form and (format.lower() in SOUNDFILE_FORMATS or format.lower() == 'pcm'):
+        try:
+            timings = {}
+            with REQUEST_SECONDS.labels("long_form").time():
+                audio_file, segment_count = render_long_form(text, voice, speed, format.lower(), timings, interrupt)
             
-            format_buffer = io.BytesIO()
-            wav_audio.export(format_buffer, format=format.lower())
-            format_buffer.seek(0)
-            output_buffer = format_buffer
+            response = send_file(
+                audio_file,
+                mimetype=get_audio_mimetype(format.lower()),
+                as_attachment=True,
+                download_name=f'speech.{format.lower()}'
+            )
+            response.headers['X-Segments'] = str(segment_count)
+            response.headers['X-Queue-Time-Ms'] = f"{timings.get('queue_ms', 0.0):.1f}"
+            response.headers['X-Inference-Time-Ms'] = f"{timings.get('inference_ms', 0.0):.1f}"
+            return response
+        except SynthesisInterrupted as e:
+            return jsonify({"error": str(e), "finish_reason": e.reason}), 504
+        except queue.Full:
+            logger.warning("Synthesis queue is full, rejecting request")
+            return (
+                jsonify({"error": "Server is busy, please retry later"}),
+                503,
+                {"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+        except Exception as e:
+            logger.error(f"Error in long-form TTS: {e}")
+            return jsonify({"error": str(e)}), 500
+    
+    try:
+        # Generate speech, reusing a cached clip when the same prompt was rendered before
+        timings = {}
+        with REQUEST_SECONDS.labels("full").time():
+            audio_bytes = get_or_render_audio(
+                text, voice, speed, format.lower(), use_cache=data.get('cache', True), timings=timings, interrupt=interrupt
+            )
         
         # Return audio file
-        return send_file(
-            output_buffer,
-            mimetype=f'audio/{format.lower()}',
+        response = send_file(
+            io.BytesIO(audio_bytes),
+            mimetype=get_audio_mimetype(format.lower()),
             as_attachment=True,
             download_name=f'speech.{format.lower()}'
         )
+        response.headers['X-Queue-Time-Ms'] = f"{timings.get('queue_ms', 0.0):.1f}"
+        response.headers['X-Inference-Time-Ms'] = f"{timings.get('inference_ms', 0.0):.1f}"
+        response.headers['X-Encode-Time-Ms'] = f"{timings.get('encode_ms', 0.0):.1f}"
+        return response
     
+    except SynthesisInterrupted as e:
+        # A hung-up client never sees this; a timed-out one gets no partial file, only the reason
+        return jsonify({"error": str(e), "finish_reason": e.reason}), 504
+    except queue.Full:
+        logger.warning("Synthesis queue is full, rejecting request")
+        return (
+            jsonify({"error": "Server is busy, please retry later"}),
+            503,
+            {"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
         logger.error(f"Error in TTS: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    # Queueing, synthesis and embedding happen in the replicas when there are any
+    registry = ReplicaMetrics(synthesis_replica_pool.metric_totals()) if synthesis_replica_pool is not None else REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route('/cache/stats', methods=['GET'])
+def audio_cache_info():
+    """Audio cache hit/miss counters and size"""
+    with audio_cache_lock:
+        return jsonify({
+            "enabled": AUDIO_CACHE_ENABLED,
+            "entries": len(audio_cache),
+            "bytes": audio_cache_bytes,
+            "max_bytes": AUDIO_CACHE_MAX_BYTES,
+            "disk_bytes": audio_cache_disk_bytes,
+            "disk_max_bytes": AUDIO_CACHE_DISK_MAX_BYTES,
+            **audio_cache_stats
+        })
+
+@app.route('/cache/warm', methods=['POST'])
+def warm_audio_cache():
+    """Pre-render a list of phrases into the audio cache"""
+    data = request.json
+    
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    phrases = data.get('phrases', [])
+    voice = data.get('voice', 'default')
+    format = data.get('format', 'mp3').lower()
+    speed = float(data.get('speed', 1.0))
+    
+    if not phrases or not isinstance(phrases, list):
+        return jsonify({"error": "A list of phrases is required"}), 400
+    if not AUDIO_CACHE_ENABLED:
+        return jsonify({"error": "Audio cache is disabled"}), 400
+    
+    def warm_phrase(phrase):
+        try:
+            get_or_render_audio(phrase, voice, speed, format)
+            return None
+        except Exception as e:
+            logger.error(f"Error warming cache for phrase '{phrase[:30]}': {e}")
+            return {"text": phrase, "error": str(e)}
+    
+    # Submit phrases concurrently so every synthesis worker is busy
+    with ThreadPoolExecutor(max_workers=SYNTHESIS_WORKERS) as executor:
+        failed = [result for result in executor.map(warm_phrase, phrases) if result is not None]
+    
+    return jsonify({
+        "warmed": len(phrases) - len(failed),
+        "failed": failed
+    })
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a bulk synthesis job from a manifest of items"""
+    data = request.json
+    
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    defaults = {
+        "voice": data.get('voice', 'default'),
+        "format": data.get('format', 'mp3'),
+        "speed": data.get('speed', 1.0)
+    }
+    items, error = validate_job_items(data.get('items'), defaults)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    job = create_job(items)
+    return jsonify(get_job_summary(job)), 202, {"Location": f"/jobs/{job['id']}"}
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List bulk synthesis jobs, newest first"""
+    with jobs_lock:
+        job_list = list(jobs.values())
+    summaries = [get_job_summary(job) for job in job_list]
+    summaries.sort(key=lambda summary: summary["created_at"], reverse=True)
+    return jsonify({"jobs": summaries})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of a bulk synthesis job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(get_job_summary(job))
+
+@app.route('/jobs/<job_id>/archive', methods=['GET'])
+def download_job_archive(job_id):
+    """Download every result of a finished job as a zip archive"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] not in ("completed", "failed"):
+        return jsonify({"error": "Job has not finished", "status": job["status"]}), 409
+    
+    return send_file(
+        os.path.join(get_job_dir(job_id), "results.zip"),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'{job_id}.zip'
+    )
+
+@app.route('/jobs/<job_id>/files', methods=['GET'])
+def list_job_files(job_id):
+    """List the result files written so far"""
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    output_dir = os.path.join(get_job_dir(job_id), "output")
+    files = sorted(filename for filename in os.listdir(output_dir) if not filename.endswith('.tmp'))
+    return jsonify({"files": files})
+
+@app.route('/jobs/<job_id>/files/<filename>', methods=['GET'])
+def download_job_file(job_id, filename):
+    """Download a single result file"""
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    format = filename.rsplit('.', 1)[-1].lower()
+    return send_from_directory(
+        os.path.join(get_job_dir(job_id), "output"),
+        filename,
+        mimetype=get_audio_mimetype(format),
+        as_attachment=True
+    )
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Cancel a queued or running job, or delete a finished job and its results"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        running = job["status"] == "running"
+        # A running job stops submitting items and removes its directory once they drain
+        job["status"] = "cancelled"
+        if not running:
+            jobs.pop(job_id)
+    
+    if not running:
+        shutil.rmtree(get_job_dir(job_id), ignore_errors=True)
+    return jsonify({"id": job_id, "status": "cancelled"})
+
 @app.route('/clone', methods=['POST'])
 def clone_voice():
     """Voice cloning endpoint"""
@@ -266,40 +2135,35 @@ def clone_voice():
     os.makedirs(voice_dir, exist_ok=True)
     
     try:
-        # Save the uploaded audio file
+        # Decode the upload from memory and resample it to the model rate
         audio_path = os.path.join(voice_dir, "reference.wav")
-        
-        # Convert to mono WAV if needed
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            audio_file.save(temp_file.name)
-            
-            # Load and resample audio to proper format
-            y, sr = librosa.load(temp_file.name, sr=DEFAULT_SAMPLING_RATE, mono=True)
-            sf.write(audio_path, y, DEFAULT_SAMPLING_RATE)
-            
-            # Clean up temp file
-            os.unlink(temp_file.name)
+        y = decode_uploaded_audio(audio_file.stream)
+        sf.write(audio_path, y, DEFAULT_SAMPLING_RATE)
         
         # Create metadata file
         metadata = {
             "id": voice_id,
             "name": name,
             "description": description,
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "pending"
         }
         
         with open(os.path.join(voice_dir, "metadata.json"), 'w') as f:
             json.dump(metadata, f)
         
-        # Extract voice embedding (this would be done in a real implementation)
-        # Here we're just pretending we did it
+        add_voice_to_index(voice_id)
+        
+        # Embedding extraction runs in the background; GET /clone/<id> reports its progress
+        submit_embedding_job(voice_id)
         
         return jsonify({
             "id": voice_id,
             "name": name,
             "description": description,
             "created_at": metadata["created_at"],
-            "status": "success"
+            "status": "success",
+            "embedding_status": "pending"
         })
     
     except Exception as e:
@@ -307,6 +2171,7 @@ def clone_voice():
         # Clean up in case of error
         if os.path.exists(voice_dir):
             shutil.rmtree(voice_dir)
+        remove_voice_from_index(voice_id)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/clone/<voice_id>', methods=['GET'])
@@ -341,6 +2206,9 @@ def delete_voice(voice_id):
     try:
         # Delete the voice directory
         shutil.rmtree(voice_dir)
+        remove_voice_from_index(voice_id)
+        invalidate_speaker_embedding(voice_id)
+        invalidate_cached_audio(voice_id)
         return jsonify({"status": "success", "message": "Voice deleted"})
     
     except Exception as e:
@@ -350,16 +2218,276 @@ def delete_voice(voice_id):
 @app.errorhandler(Exception)
 def handle_exception(e):
     """General error handler"""
+    if isinstance(e, HTTPException):
+        # Client errors such as 413 for oversized uploads keep their status code
+        return jsonify({"error": e.description}), e.code
     logger.error(f"Error: {str(e)}")
     return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
+def parse_cpu_list(spec):
+    """Parse a core list such as "0-3,8" into a set of core ids"""
+    cores = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cores.update(range(int(first), int(last) + 1))
+        else:
+            cores.add(int(part))
+    return cores
+
+def get_worker_cores(worker_index):
+    """Cores a worker is pinned to: its group from TTS_CPU_CORES, or an even share of the cores when replicated"""
+    if CPU_CORES:
+        # Core groups are separated by ';', worker N is pinned to group N
+        groups = [group for group in CPU_CORES.split(';') if group.strip()]
+        return parse_cpu_list(groups[worker_index % len(groups)])
+    if TTS_REPLICAS > 1:
+        available = sorted(os.sched_getaffinity(0))
+        share = max(1, len(available) // TTS_REPLICAS)
+        return set(available[worker_index * share:(worker_index + 1) * share] or available)
+    return None
+
+def configure_cpu_runtime(worker_index=0):
+    """Pin the process to its cores and size the torch thread pools; must run before the models are used"""
+    if DEVICE.type != 'cpu':
+        return
+    
+    cpu_info = {"engine": CPU_ENGINE, "cores": None}
+    cores = get_worker_cores(worker_index) if worker_index is not None and hasattr(os, "sched_setaffinity") else None
+    if cores:
+        os.sched_setaffinity(0, cores)
+        cpu_info["cores"] = sorted(cores)
+    
+    # One intra-op thread per usable core unless set explicitly
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(CPU_THREADS or available)
+    try:
+        torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+    except RuntimeError:
+        logger.warning("Inter-op thread pool already started, keeping its size")
+    
+    cpu_info["threads"] = torch.get_num_threads()
+    cpu_info["interop_threads"] = torch.get_num_interop_threads()
+    startup_state["cpu"] = cpu_info
+    logger.info(f"CPU runtime: {cpu_info['threads']} threads, {cpu_info['interop_threads']} inter-op threads, cores {cpu_info['cores'] or 'all'}")
+
+def measure_synthesis_latency(runs=2):
+    """Best wall time of synthesizing the warmup text with the first preset voice, in milliseconds"""
+    best = None
+    for _ in range(runs):
+        start_time = time.time()
+        with torch.inference_mode():
+            converter.tts(WARMUP_TEXT, voice_preset=PRESET_VOICE_IDS[0], speed_modifier=1.0)
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 1)
+
+def compile_synthesis_models():
+    """Compile the acoustic model and vocoder, falling back to eager if either fails; True if they run compiled
+    
+    The speaker encoder only runs once per cloned voice, so it stays eager.
+    """
+    models = [model for model in (base_model, vocoder) if isinstance(model, torch.nn.Module)]
+    try:
+        for model in models:
+            model.compile(dynamic=True)
+        # compile() only installs a lazy wrapper; Dynamo and Inductor errors surface on the first call
+        with torch.inference_mode():
+            converter.tts(WARMUP_TEXT, voice_preset=PRESET_VOICE_IDS[0], speed_modifier=1.0)
+    except Exception as e:
+        for model in models:
+            model._compiled_call_impl = None
+        logger.warning(f"Graph compilation failed, running eagerly: {e}")
+        return False
+    return True
+
+def apply_cpu_engine():
+    """Quantize the models' linear layers to int8 and optionally compile them, comparing latency with the eager path"""
+    if DEVICE.type != 'cpu' or CPU_ENGINE != 'optimized':
+        return
+    
+    cpu_info = startup_state["cpu"] or {"engine": CPU_ENGINE}
+    startup_state["cpu"] = cpu_info
+    if CPU_ENGINE_BENCHMARK:
+        cpu_info["eager_ms"] = measure_synthesis_latency()
+    
+    start_time = time.time()
+    for model in (base_model, speaker_encoder, vocoder):
+        if isinstance(model, torch.nn.Module):
+            # In place, so the converter keeps using the same module objects
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    cpu_info["compiled"] = CPU_COMPILE and compile_synthesis_models()
+    cpu_info["optimize_seconds"] = round(time.time() - start_time, 3)
+    
+    if CPU_ENGINE_BENCHMARK:
+        # Compilation already happened in compile_synthesis_models, the best of the runs still smooths out noise
+        cpu_info["optimized_ms"] = measure_synthesis_latency()
+        cpu_info["speedup"] = round(cpu_info["eager_ms"] / cpu_info["optimized_ms"], 2)
+        logger.info(f"CPU engine: warmup text in {cpu_info['optimized_ms']}ms (eager {cpu_info['eager_ms']}ms, {cpu_info['speedup']}x)")
+    else:
+        logger.info("CPU engine: int8 dynamic quantization applied")
+
+def warmup_models():
+    """Run a short synthesis per preset voice so kernels and allocators are primed"""
+    for voice in PRESET_VOICES:
+        start_time = time.time()
+        encode_audio(synthesize_audio(WARMUP_TEXT, voice["id"]), 'mp3')
+        logger.info(f"Warmed up voice {voice['id']} in {time.time() - start_time:.3f}s")
+
+def uses_synthesis_replicas():
+    """Whether synthesis runs in forked replicas rather than in the serving process"""
+    return TTS_REPLICAS > 1 and DEVICE.type == 'cpu'
+
+def load_service():
+    """Load the models and apply the CPU engine; False if the models are unusable"""
+    startup_state["status"] = "loading"
+    start_time = time.time()
+    
     # Try to load models at startup
     try:
         load_models()
     except Exception as e:
         logger.error(f"Error loading models at startup: {e}")
+    startup_state["load_seconds"] = round(time.time() - start_time, 3)
+    
+    if base_model is None or speaker_encoder is None or vocoder is None or converter is None:
+        startup_state["status"] = "failed"
+        startup_state["error"] = "Models not loaded. Please check logs for details."
         logger.info("The server will continue to run, but TTS functionality may be limited")
+        return False
+    
+    try:
+        apply_cpu_engine()
+    except Exception as e:
+        logger.error(f"Error applying the CPU engine, keeping the eager models: {e}")
+    return True
+
+def run_startup():
+    """Load and warm up the models, then mark the service ready"""
+    if not load_service():
+        return
+    
+    if WARMUP_ENABLED:
+        startup_state["status"] = "warming_up"
+        start_time = time.time()
+        try:
+            warmup_models()
+        except Exception as e:
+            logger.error(f"Error during warmup: {e}")
+            startup_state["status"] = "failed"
+            startup_state["error"] = f"Warmup failed: {e}"
+            return
+        startup_state["warmup_seconds"] = round(time.time() - start_time, 3)
     
-    # Start the Flask app
-    app.run(host='0.0.0.0', port=SERVE_PORT, debug=False)
\ No newline at end of file
+    startup_state["status"] = "ready"
+    logger.info(f"TTS service ready (load {startup_state['load_seconds']}s, warmup {startup_state['warmup_seconds']}s)")
+
+def wait_for_replicas(pool, start_time):
+    """Mark the service ready once the forked replicas have warmed up"""
+    global synthesis_replica_pool
+    
+    try:
+        pool.wait_ready()
+    except Exception as e:
+        logger.error(f"Error starting synthesis replicas: {e}")
+        startup_state["status"] = "failed"
+        startup_state["error"] = f"Replicas failed to start: {e}"
+        return
+    synthesis_replica_pool = pool
+    startup_state["replicas"] = len(pool.ready)
+    startup_state["warmup_seconds"] = round(time.time() - start_time, 3)
+    startup_state["status"] = "ready"
+    logger.info(f"TTS service ready with {len(pool.ready)} replicas (load {startup_state['load_seconds']}s, warmup {startup_state['warmup_seconds']}s)")
+
+def prepare_service():
+    """Pin the process and index voices; with replicas the models load here too, since they must exist before the fork"""
+    # Replicas pin themselves after the fork; the parent loads with every core
+    configure_cpu_runtime(0 if TTS_REPLICAS <= 1 else None)
+    
+    # Index the voice catalog before serving requests
+    build_voice_index()
+    
+    if TTS_REPLICAS > 1 and DEVICE.type != 'cpu':
+        logger.warning("CUDA state can't be shared with forked processes, serving with a single replica")
+    if uses_synthesis_replicas():
+        load_service()
+
+def start_serving():
+    """Fork the synthesis replicas while this is still the only thread, then start the background threads"""
+    pool = None
+    if uses_synthesis_replicas() and startup_state["status"] != "failed":
+        # Replicas warm themselves up; the service is ready once they all have
+        startup_state["status"] = "warming_up"
+        try:
+            pool = SynthesisReplicaPool(TTS_REPLICAS)
+        except Exception as e:
+            logger.error(f"Error starting synthesis replicas: {e}")
+            startup_state["status"] = "failed"
+            startup_state["error"] = f"Replicas failed to start: {e}"
+    
+    # Bulk jobs interrupted by a restart resume once the models are ready
+    load_jobs()
+    threading.Thread(target=job_worker_loop, name="job-worker", daemon=True).start()
+    
+    if pool is not None:
+        threading.Thread(target=wait_for_replicas, args=(pool, time.time()), name="tts-startup", daemon=True).start()
+    elif not uses_synthesis_replicas():
+        # Models load in the background so /health and /ready answer while the service warms up
+        startup_state["status"] = "loading"
+        threading.Thread(target=run_startup, name="tts-startup", daemon=True).start()
+
+def start_service():
+    """Index voices and start loading the models in the serving process"""
+    prepare_service()
+    start_serving()
+
+def boot_worker(worker):
+    """Start in a gunicorn worker, heartbeating so the arbiter doesn't kill a replica-mode load that outlasts the timeout"""
+    stop = threading.Event()
+    
+    def send_heartbeats():
+        while not stop.wait(BOOT_HEARTBEAT_SECONDS):
+            worker.notify()
+    
+    heartbeat = threading.Thread(target=send_heartbeats, name="boot-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        prepare_service()
+    finally:
+        stop.set()
+        heartbeat.join()
+    # Replicas are forked only once the heartbeat thread is gone, so this is still the only thread
+    start_serving()
+
+def run_production_server():
+    """Serve with gunicorn: one worker process owns the models, a bounded pool of threads handles requests"""
+    from gunicorn.app.base import BaseApplication
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{SERVE_PORT}")
+            # A single worker keeps one copy of the models; requests share it through the scheduler
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", SERVE_THREADS)
+            self.cfg.set("worker_connections", SERVE_THREADS + TTS_MAX_QUEUE_DEPTH)
+            self.cfg.set("timeout", 120)
+            # Load after fork so CUDA is initialized in the worker, not the master
+            self.cfg.set("post_worker_init", boot_worker)
+        
+        def load(self):
+            return app
+    
+    ProductionServer().run()
+
+if __name__ == '__main__':
+    if SERVE_MODE == 'production':
+        run_production_server()
+    else:
+        start_service()
+        
+        # Start the Flask development server
+        app.run(host='0.0.0.0', port=SERVE_PORT, debug=False)
\ No newline at end of file